@@ -0,0 +1,69 @@
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from utils.fire_plan import future_savings
+from utils.return_models import NormalReturns
+from utils.simulation import run_monte_carlo
+
+# Cost of the monthly engine relative to the annual one: wall time and peak traced memory
+# of run_monte_carlo with the page's default inputs, plus the deterministic projection
+# over a grid of scenarios. Run from the repository root:
+#
+#     python -m benchmarks.monthly_engine --trials 200000
+
+CONFIGURATIONS = [
+    ("annual, float64", dict(periods_per_year=1, dtype="float64")),
+    ("monthly, float64", dict(periods_per_year=12, dtype="float64")),
+    ("monthly, float32", dict(periods_per_year=12, dtype="float32")),
+    ("monthly, float32, streaming", dict(periods_per_year=12, dtype="float32", streaming=True)),
+]
+
+
+def measure(function, repeats):
+    # (best wall time in seconds, peak traced memory in MiB, last result)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak / 1024 ** 2, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the monthly simulation engine against the annual one")
+    parser.add_argument("--trials", type=int, default=200_000)
+    parser.add_argument("--years", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    return_model = NormalReturns(means=[0.07, 0.15], std_devs=[0.10, 0.30])
+    print(f"Monte Carlo: {args.trials:,} trials over {args.years} years")
+    print(f"{'configuration':<30}{'time (s)':>10}{'relative':>10}{'peak MiB':>10}{'median':>14}")
+    baseline = None
+    for name, options in CONFIGURATIONS:
+        seconds, peak, result = measure(
+            lambda: run_monte_carlo(500_000, 32_000, args.years, [0.85, 0.15], return_model, 0.03, args.trials, seed=0, **options),
+            args.repeats,
+        )
+        baseline = baseline or seconds
+        print(f"{name:<30}{seconds:>10.3f}{seconds / baseline:>9.1f}x{peak:>10.1f}{result.percentiles[1, -1]:>14,.0f}")
+
+    rates = np.linspace(-0.02, 0.12, 1_000)[:, None]
+    horizons = np.arange(0, 51)[None, :]
+    print(f"\nDeterministic projection: {rates.size * horizons.size:,} scenarios")
+    baseline = None
+    for periods_per_year in (1, 12):
+        seconds, peak, _ = measure(lambda: future_savings(500_000, 32_000, rates, horizons, periods_per_year), args.repeats)
+        baseline = baseline or seconds
+        print(f"{f'{periods_per_year} periods per year':<30}{seconds:>10.4f}{seconds / baseline:>9.1f}x{peak:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,20 @@
 import streamlit as st
 import logging
 
+import numpy as np
+
+from utils.assets import ASSET_CLASSES, DEFAULT_ALLOCATIONS, DEFAULT_CUSTOM_VOLATILITY, asset_registry
+from utils.fire_plan import FireInputs, calculate_fire_plan, savings_trajectories, what_if_surface
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 
+# Each section's calculation is cached on just the inputs it reads, so a widget change
+# only recomputes the sections that depend on it
+cached_fire_plan = st.cache_data(show_spinner=False)(calculate_fire_plan)
+cached_savings_trajectories = st.cache_data(show_spinner=False)(savings_trajectories)
+cached_what_if_surface = st.cache_data(show_spinner=False)(what_if_surface)
+
 # Heading
 st.markdown("<h1 style='color: #F39373; padding-bottom: 30px;'>🔥 FIRE (Financial Independence, Retire Early) Calculator</h1>", unsafe_allow_html=True)
 st.markdown("""
@@ -42,44 +53,32 @@ with col2:
     desired_fire_age = st.number_input("Desired FIRE Age", min_value=0, value=55, step=1)
     savings_rate = st.number_input("Savings Rate (%)", min_value=-100.0, value=40.0, step=0.1)
     inflation_rate = st.number_input("Inflation Rate (%)", min_value=0.0, value=3.0, step=0.1)
+    monthly_steps = st.checkbox("Save and compound monthly", key="monthly_steps", help="Pay your savings in monthly instalments and compound returns every month, instead of once a year")
+periods_per_year = 12 if monthly_steps else 1
     
 
 # Streamlit: Advanced options for Expected Annual Return on Investments (%)
 with st.sidebar:
     st.markdown("<h2 style='color: #F39373; padding-bottom: 40px;'>Expected Annual Return on Investments (%)</h2>", unsafe_allow_html=True)
-    equities_percentage = st.number_input("% of Equities", min_value=0.0, max_value=100.0, value=70.0, step=0.1)
-    fixed_income_percentage = st.number_input("% of Fixed Income", min_value=0.0, max_value=100.0, value=20.0, step=0.1)
-    cash_percentage = st.number_input("% of Cash", min_value=0.0, max_value=100.0, value=10.0, step=0.1)
-    cash_equivalents_percentage = st.number_input("% of Cash Equivalents", min_value=0.0, max_value=100.0, value=0.0, step=0.1)
-    commodities_percentage = st.number_input("% of Commodities", min_value=0.0, max_value=100.0, value=0.0, step=0.1)
-    real_estate_percentage = st.number_input("% of Real Estate", min_value=0.0, max_value=100.0, value=0.0, step=0.1)
-    cryptocurrency_percentage = st.number_input("% of Cryptocurrency", min_value=0.0, max_value=100.0, value=0.0, step=0.1)
-    reits_percentage = st.number_input("% of REITs", min_value=0.0, max_value=100.0, value=0.0, step=0.1)
-    alternatives_percentage = st.number_input("% of Alternatives", min_value=0.0, max_value=100.0, value=0.0, step=0.1)
-    cpf_percentage = st.number_input("% of CPF or Retirement", min_value=0.0, max_value=100.0, value=0.0, step=0.1)
+    asset_allocations = {
+        key: st.number_input(f"% of {label}", min_value=0.0, max_value=100.0, value=DEFAULT_ALLOCATIONS.get(key, 0.0), step=0.1, key=f"{key}_percentage")
+        for key, label, _, _ in ASSET_CLASSES
+    }
 
     st.markdown("<h4 style='color: #F39373; padding-top: 20px; padding-bottom: 20px;'>Adjust Default Growth Rates for Each Asset Type</h4>", unsafe_allow_html=True)
     st.markdown("<p style='font-size: medium; font-style: italic;'>Adjust these growth rate estimates if you would like to use different assumptions</p>", unsafe_allow_html=True)
     with st.expander("Adjust Growth Rates for Each Asset Type"):
-        equities_growth_rate = st.slider("Equities Growth Rate (%)", min_value=0.0, max_value=100.0, value=10.0, step=0.1)
-        fixed_income_growth_rate = st.slider("Fixed Income Growth Rate (%)", min_value=0.0, max_value=100.0, value=4.0, step=0.1)
-        cash_growth_rate = st.slider("Cash Growth Rate (%)", min_value=0.0, max_value=100.0, value=0.0, step=0.1)
-        cash_equivalents_growth_rate = st.slider("Cash Equivalents Growth Rate (%)", min_value=0.0, max_value=100.0, value=2.0, step=0.1)
-        real_estate_growth_rate = st.slider("Real Estate Growth Rate (%)", min_value=0.0, max_value=100.0, value=4.0, step=0.1)
-        cryptocurrency_growth_rate = st.slider("Cryptocurrency Growth Rate (%)", min_value=0.0, max_value=100.0, value=15.0, step=0.1)
-        commodities_growth_rate = st.slider("Commodities Growth Rate (%)", min_value=0.0, max_value=100.0, value=3.0, step=0.1)
-        reits_growth_rate = st.slider("REITs Growth Rate (%)", min_value=0.0, max_value=100.0, value=6.0, step=0.1)
-        alternatives_growth_rate = st.slider("Alternatives Growth Rate (%)", min_value=0.0, max_value=100.0, value=8.0, step=0.1)
-        cpf_growth_rate = st.slider("CPF Growth Rate (%)", min_value=0.0, max_value=100.0, value=4.0, step=0.1)
-
-# Ensure the total percentage is 100%
-total_percentage = (
-    equities_percentage + fixed_income_percentage + cash_percentage +
-    cash_equivalents_percentage + real_estate_percentage + cryptocurrency_percentage +
-    commodities_percentage + reits_percentage + alternatives_percentage + cpf_percentage
-)
-if total_percentage != 100.0:
-    st.error("The total percentage of all asset types must equal 100%. Please adjust the values.")
+        asset_growth_rates = {
+            key: st.slider(f"{label} Growth Rate (%)", min_value=0.0, max_value=100.0, value=growth_rate, step=0.1, key=f"{key}_growth_rate")
+            for key, label, growth_rate, _ in ASSET_CLASSES
+        }
+
+    st.markdown("<p style='font-size: medium; font-style: italic;'>Volatility (standard deviation) assumptions are only used by the correlated simulation below</p>", unsafe_allow_html=True)
+    with st.expander("Adjust Volatility for Each Asset Type"):
+        asset_volatilities = {
+            key: st.slider(f"{label} Volatility (%)", min_value=0.0, max_value=200.0, value=volatility, step=0.1, key=f"{key}_volatility")
+            for key, label, _, volatility in ASSET_CLASSES
+        }
 
 # Custom asset fields
 with st.sidebar:
@@ -93,8 +92,9 @@ with st.sidebar:
             asset_name = st.text_input(f"Name of Asset {i+1}", key=f"asset_name_{i}")
             asset_allocation = st.number_input(f"Allocation (%) for {asset_name}", min_value=0.0, max_value=100.0, value=0.0, step=0.1, key=f"asset_allocation_{i}")
             asset_growth_rate = st.number_input(f"Growth Rate (%) for {asset_name}", min_value=0.0, value=0.0, step=0.1, key=f"asset_growth_rate_{i}")
+            asset_volatility = st.number_input(f"Volatility (%) for {asset_name}", min_value=0.0, value=DEFAULT_CUSTOM_VOLATILITY, step=0.1, key=f"asset_volatility_{i}")
             if asset_name and asset_allocation > 0:
-                custom_assets.append((asset_name, asset_allocation, asset_growth_rate))
+                custom_assets.append((asset_name, asset_allocation, asset_growth_rate, asset_volatility))
 
     # Button to add more custom asset fields
     if 'custom_asset_count' not in st.session_state:
@@ -106,51 +106,22 @@ with st.sidebar:
             asset_name = st.text_input(f"Name of Asset {i+1}", key=f"asset_name_{i}")
             asset_allocation = st.number_input(f"Allocation (%) for {asset_name}", min_value=0.0, max_value=100.0, value=0.0, step=0.1, key=f"asset_allocation_{i}")
             asset_growth_rate = st.number_input(f"Growth Rate (%) for {asset_name}", min_value=0.0, value=0.0, step=0.1, key=f"asset_growth_rate_{i}")
+            asset_volatility = st.number_input(f"Volatility (%) for {asset_name}", min_value=0.0, value=DEFAULT_CUSTOM_VOLATILITY, step=0.1, key=f"asset_volatility_{i}")
             if asset_name and asset_allocation > 0:
-                custom_assets.append((asset_name, asset_allocation, asset_growth_rate))
+                custom_assets.append((asset_name, asset_allocation, asset_growth_rate, asset_volatility))
 
     # Move the button to add more custom asset fields below the last custom asset
     if st.button("Add Custom Asset"):
         st.session_state.custom_asset_count += 1
+# Built-in and custom assets as aligned arrays
+portfolio_assets = asset_registry(asset_allocations, asset_growth_rates, asset_volatilities, custom_assets)
+
 # Ensure the total percentage is 100%
-total_percentage = (
-    equities_percentage + fixed_income_percentage + cash_percentage +
-    cash_equivalents_percentage + real_estate_percentage + cryptocurrency_percentage +
-    commodities_percentage + reits_percentage + alternatives_percentage + cpf_percentage +
-    sum(asset_allocation for _, asset_allocation, _ in custom_assets)
-)
-if total_percentage != 100.0:
+if not np.isclose(portfolio_assets.total_allocation, 100.0):
     st.error("The total percentage of all asset types must equal 100%. Please adjust the values.")
 
-# Calculate the blended annual return
-blended_annual_return = (
-    (equities_percentage * equities_growth_rate) +
-    (fixed_income_percentage * fixed_income_growth_rate) +
-    (cash_percentage * cash_growth_rate) +
-    (cash_equivalents_percentage * cash_equivalents_growth_rate) +
-    (real_estate_percentage * real_estate_growth_rate) +
-    (cryptocurrency_percentage * cryptocurrency_growth_rate) +
-    (commodities_percentage * commodities_growth_rate) +
-    (reits_percentage * reits_growth_rate) +
-    (alternatives_percentage * alternatives_growth_rate)
-)
-
-# Add custom assets to the blended annual return calculation
-for asset_name, asset_allocation, asset_growth_rate in custom_assets:
-    blended_annual_return += (asset_allocation * asset_growth_rate)
-
-# Normalize the blended annual return by the total allocation
-total_allocation = (
-    equities_percentage + fixed_income_percentage + cash_percentage +
-    cash_equivalents_percentage + real_estate_percentage + cryptocurrency_percentage +
-    commodities_percentage + reits_percentage + alternatives_percentage +
-    sum(asset_allocation for _, asset_allocation, _ in custom_assets)
-)
-
-if total_allocation > 0:
-    blended_annual_return /= total_allocation
-else:
-    blended_annual_return = 0.0
+# Blended annual return, weighted by allocation
+blended_annual_return = portfolio_assets.blended_return
 
 st.markdown(f"""
 <div style='padding-top: 10px; text-align: left;'>
@@ -164,136 +135,45 @@ st.markdown("<hr>", unsafe_allow_html=True)
 
 
 
-def calculate_fire_plan(age, desired_fire_age, annual_expenses, current_savings, annual_return, annual_income, savings_rate, inflation_rate):
-    # Calculate FIRE number
-    fire_number = 25 * annual_expenses
-    
-    # Calculate real rate of return
-    real_rate_of_return = (annual_return - inflation_rate) / 100
-    
-    # Calculate current savings growth
-    n = desired_fire_age - age
-    try:
-        current_savings_growth = current_savings * (1 + real_rate_of_return) ** n
-        logging.info(f"Current Savings Growth: {current_savings_growth}")
-    except OverflowError:
-        current_savings_growth = float('inf')
-        st.error("Current savings growth calculation overflowed. Please check the input values.")
-        logging.error("OverflowError: Current savings growth calculation overflowed.")
-    
-    # Calculate annual savings amount
-    annual_savings = annual_income * (savings_rate / 100)
-    
-    # Calculate annual savings growth using future value of an annuity formula
-    try:
-        if real_rate_of_return != 0:
-            annual_savings_growth = annual_savings * (((1 + real_rate_of_return) ** n - 1) / real_rate_of_return)
-        else:
-            annual_savings_growth = annual_savings * n
-        logging.info(f"Annual Savings Growth: {annual_savings_growth}")
-    except OverflowError:
-        annual_savings_growth = float('inf')
-        st.error("Annual savings growth calculation overflowed. Please check the input values.")
-        logging.error("OverflowError: Annual savings growth calculation overflowed.")
-    
-    # Calculate actual savings at desired FIRE age
-    actual_savings_at_desired_fire_age = current_savings_growth + annual_savings_growth
-    logging.info(f"Actual Savings at Desired FIRE Age: {actual_savings_at_desired_fire_age}")
-    
-    # Compare actual savings to FIRE number
-    if actual_savings_at_desired_fire_age >= fire_number:
-        can_retire = True
-        gap = 0
-        additional_years_needed = 0
-        max_additional_years = 0  # Define max_additional_years to avoid UnboundLocalError
-    else:
-        can_retire = False
-        gap = fire_number - actual_savings_at_desired_fire_age
-        additional_years_needed = 0
-        max_additional_years = 100  # Cap the number of additional years to prevent infinite loop and overflow
-        while actual_savings_at_desired_fire_age < fire_number and additional_years_needed < max_additional_years:
-            additional_years_needed += 1
-            try:
-                actual_savings_at_desired_fire_age += annual_savings * (1 + real_rate_of_return) ** additional_years_needed
-                logging.info(f"Additional Years Needed: {additional_years_needed}, Actual Savings: {actual_savings_at_desired_fire_age}")
-            except OverflowError:
-                actual_savings_at_desired_fire_age = float('inf')
-                st.error("Additional years needed calculation overflowed. Please check the input values.")
-                logging.error("OverflowError: Additional years needed calculation overflowed.")
-                break
-        if additional_years_needed >= max_additional_years:
-            st.warning("The number of additional years needed exceeded the maximum limit. The calculation might not be accurate.")
-        # Reset actual_savings_at_desired_fire_age to the correct value for printing
-        actual_savings_at_desired_fire_age = current_savings_growth + annual_savings_growth
-    
-    st.markdown("<h2 style='color: #F39373;'>Results</h2>", unsafe_allow_html=True)
-    
-    # Prepare the scratchpad
-    scratchpad = f"""
+fire_inputs = FireInputs(
+    age, desired_fire_age, annual_expenses, current_savings,
+    blended_annual_return, annual_income, savings_rate, inflation_rate, periods_per_year
+)
+fire_plan = cached_fire_plan(fire_inputs)
+for message in fire_plan.warnings:
+    st.warning(message)
+fire_number = fire_plan.fire_number
+real_rate_of_return = fire_plan.real_rate_of_return
+annual_savings = fire_plan.annual_savings
+actual_savings_at_desired_fire_age = fire_plan.actual_savings_at_desired_fire_age
+
+st.markdown("<h2 style='color: #F39373;'>Results</h2>", unsafe_allow_html=True)
+st.markdown(f"""
     <scratchpad style='font-size: 18px;'>
     FIRE number: ${fire_number:,.2f}<br>
     Actual savings at desired FIRE age: ${actual_savings_at_desired_fire_age:,.2f}<br>
     </scratchpad>
-    """
-    scratchpad += "<br><br>"
-    
-    return scratchpad, actual_savings_at_desired_fire_age, fire_number, can_retire, current_savings_growth, annual_savings_growth, real_rate_of_return, annual_savings, max_additional_years
-
-# Example usage with Streamlit inputs
-scratchpad_and_answer, actual_savings_at_desired_fire_age, fire_number, can_retire, current_savings_growth, annual_savings_growth, real_rate_of_return, annual_savings, max_additional_years = calculate_fire_plan(
-    age, desired_fire_age, annual_expenses, current_savings, 
-    blended_annual_return, annual_income, savings_rate, inflation_rate
-)
-st.markdown(scratchpad_and_answer, unsafe_allow_html=True)
+    <br><br>
+""", unsafe_allow_html=True)
 
-if actual_savings_at_desired_fire_age >= fire_number:
+if fire_plan.can_retire:
     st.markdown(f"<h3 style='color: green;'>Congratulations! You will be able to FIRE by {desired_fire_age}.</h3>", unsafe_allow_html=True)
 else:
-    gap = fire_number - actual_savings_at_desired_fire_age
-    st.markdown(f"<h3 style='color: red;'>You currently have a gap of ${gap:,.2f} to reach your FIRE number.</h3>", unsafe_allow_html=True)
-
-if not can_retire:
-    additional_years_needed = 0
-    max_additional_years = 100  # Ensure max_additional_years is defined outside the function for consistency
-    while actual_savings_at_desired_fire_age < fire_number and additional_years_needed < max_additional_years:
-        additional_years_needed += 1
-        actual_savings_at_desired_fire_age += annual_savings * (1 + real_rate_of_return) ** additional_years_needed
-        logging.info(f"Additional Years Needed: {additional_years_needed}, Actual Savings: {actual_savings_at_desired_fire_age}")
-    fire_age = age + additional_years_needed
-    if additional_years_needed >= max_additional_years:
-        st.warning("The number of additional years needed exceeded the maximum limit. The calculation might not be accurate.")
-    
-    # if additional_years_needed >= max_additional_years:
-    #     st.warning("The number of additional years needed exceeded the maximum limit. The calculation might not be accurate.")
-
+    st.markdown(f"<h3 style='color: red;'>You currently have a gap of ${fire_plan.gap:,.2f} to reach your FIRE number.</h3>", unsafe_allow_html=True)
+    if fire_plan.additional_years_needed != float('inf'):
+        st.markdown(f"<p style='font-size: 16px;'>Saving at your current rate for another {fire_plan.additional_years_needed:.1f} years after {desired_fire_age} would close the gap.</p>", unsafe_allow_html=True)
 
 
 #Add in some basic charts
 
 import altair as alt
+import numpy as np
 import pandas as pd
 
-# Create a DataFrame for the actual savings trajectory
-actual_savings_data = {
-    'Age': list(range(int(age), int(desired_fire_age) + 1)),
-    'Savings': [
-        current_savings * (1 + real_rate_of_return) ** i + 
-        annual_savings * (((1 + real_rate_of_return) ** i - 1) / real_rate_of_return)
-        for i in range(int(desired_fire_age) - int(age) + 1)
-    ]
-}
-actual_savings_df = pd.DataFrame(actual_savings_data)
-
-# Calculate the required growth rate to hit the FIRE number by the desired FIRE age
-required_growth_rate = (fire_number / current_savings) ** (1 / (desired_fire_age - age)) - 1
-
-# Create a DataFrame for the required savings trajectory
-required_savings_data = {
-    'Age': list(range(int(age), int(desired_fire_age) + 1)),
-    'Savings': [current_savings * (1 + required_growth_rate) ** i for i in range(int(desired_fire_age) - int(age) + 1)]
-}
-
-required_savings_df = pd.DataFrame(required_savings_data)
+# Actual and required savings trajectories up to the desired FIRE age
+trajectory_ages, projected_savings, required_savings = cached_savings_trajectories(fire_inputs, fire_plan)
+actual_savings_df = pd.DataFrame({'Age': trajectory_ages, 'Savings': projected_savings})
+required_savings_df = pd.DataFrame({'Age': trajectory_ages, 'Savings': required_savings})
 
 # Create the actual savings chart
 # Ensure the 'Age' field is treated as an ordinal scale to avoid gaps for odd-numbered years
@@ -322,19 +202,14 @@ st.markdown("<div style='padding-top: 40px;'></div>", unsafe_allow_html=True)
 st.altair_chart(combined_chart, use_container_width=True)
 
 
-# Calculate the age at which the user would reach their FIRE number
-def calculate_fire_age(current_savings, annual_savings, real_rate_of_return, fire_number):
-    age = 0
-    while current_savings < fire_number:
-        current_savings = current_savings * (1 + real_rate_of_return) + annual_savings
-        age += 1
-    return age
-
-# Calculate the age to reach FIRE number
-fire_age = calculate_fire_age(current_savings, annual_savings, real_rate_of_return, fire_number)
+# Age to reach FIRE number (fractional years, inf if never reached)
+fire_age = fire_plan.years_to_fire
 
 # Print the age to reach FIRE number
-st.markdown(f"<h3 style='color: #F39373;'>You will reach your FIRE number at age: {int(age) + fire_age}</h3>", unsafe_allow_html=True)
+if fire_age == float('inf'):
+    st.markdown("<h3 style='color: #F39373;'>With your current savings rate and returns, you will not reach your FIRE number.</h3>", unsafe_allow_html=True)
+else:
+    st.markdown(f"<h3 style='color: #F39373;'>You will reach your FIRE number at age: {age + fire_age:.1f}</h3>", unsafe_allow_html=True)
 
 
 # Sensitivity Analysis Heading
@@ -346,27 +221,21 @@ st.markdown("""
     </p>
 """, unsafe_allow_html=True)
 
-# Create a DataFrame to store the savings at desired FIRE age for different savings rates
-savings_rates = list(range(10, 85, 5))
-savings_at_fire_age = []
-
-for rate in savings_rates:
-    annual_savings_rate = rate / 100 * annual_income
-    savings = current_savings
-    for i in range(int(desired_fire_age) - int(age) + 1):
-        savings = savings * (1 + real_rate_of_return) + annual_savings_rate
-    savings_at_fire_age.append(savings)
-
-# Ensure the savings calculated at the FIRE age match with the calculations above
-savings_at_fire_age_corrected = [
-    current_savings * (1 + real_rate_of_return) ** (desired_fire_age - age) + 
-    (rate / 100 * annual_income) * (((1 + real_rate_of_return) ** (desired_fire_age - age) - 1) / real_rate_of_return)
-    for rate in savings_rates
-]
+# Savings for every combination of savings rate, annual return and horizon, in one broadcast
+fire_horizon = max(int(desired_fire_age - age), 0)
+what_if_savings_rates = np.union1d(np.arange(0, 100.5, 2.5), [savings_rate])
+what_if_annual_returns = np.union1d(np.arange(0, 15.25, 0.25), [blended_annual_return])
+what_if_horizons = np.arange(0, max(40, fire_horizon) + 1)
+what_if_savings = cached_what_if_surface(current_savings, annual_income, what_if_savings_rates, what_if_annual_returns, what_if_horizons, inflation_rate, periods_per_year)
 
+# Table slices at your blended return / savings rate and desired FIRE age
+savings_rates = list(range(10, 85, 5))
 savings_rate_data = {
     'Savings Rate (%)': [f"{rate}%" for rate in savings_rates],
-    'Savings at FIRE Age': [f"${savings:,.0f}" for savings in savings_at_fire_age_corrected]
+    'Savings at FIRE Age': [
+        f"${savings:,.0f}"
+        for savings in what_if_savings[np.searchsorted(what_if_savings_rates, savings_rates), np.searchsorted(what_if_annual_returns, blended_annual_return), fire_horizon]
+    ]
 }
 
 savings_rate_df = pd.DataFrame(savings_rate_data)
@@ -377,28 +246,7 @@ st.dataframe(savings_rate_df.style.set_properties(**{'font-size': '14pt', 'text-
 
 # Create a range of annual returns from 3.0% to 12.0%, incrementing by 0.5%
 annual_return_rates = [round(x * 0.5, 1) for x in range(6, 25)]
-
-# Initialize lists to store the results
-adjusted_annual_returns = []
-savings_at_fire_age = []
-
-# Pull the inflation_rate from the inputs above
-inflation_rate = st.session_state.get('inflation_rate', 3.0)
-
-# Calculate the savings projections for each annual return rate
-for annual_return in annual_return_rates:
-    adjusted_annual_return = annual_return - inflation_rate
-    current_savings_growth = current_savings * ((1 + adjusted_annual_return / 100) ** (desired_fire_age - age))
-    
-    # Avoid division by zero by checking if adjusted_annual_return is zero
-    if adjusted_annual_return != 0:
-        annual_savings_growth = annual_savings * (((1 + adjusted_annual_return / 100) ** (desired_fire_age - age) - 1) / (adjusted_annual_return / 100))
-    else:
-        annual_savings_growth = annual_savings * (desired_fire_age - age)  # Simple linear growth if return is zero
-    
-    total_savings_at_fire_age = round(current_savings_growth + annual_savings_growth)
-    
-    savings_at_fire_age.append(total_savings_at_fire_age)
+savings_at_fire_age = what_if_savings[np.searchsorted(what_if_savings_rates, savings_rate), np.searchsorted(what_if_annual_returns, annual_return_rates), fire_horizon]
 
 # Create a DataFrame to store the results
 sensitivity_data = {
@@ -410,6 +258,28 @@ sensitivity_df = pd.DataFrame(sensitivity_data)
 # Display the table in Streamlit
 st.markdown("**<h4>Savings Based on Annual Return Rate</h4>**", unsafe_allow_html=True)
 st.dataframe(sensitivity_df.style.set_properties(**{'font-size': '14pt', 'text-align': 'left'}), height=400, width=600)  # Set width to 3/4 of 800
+
+# Heatmap of the full surface for a chosen horizon
+st.markdown("**<h4>Savings Rate vs. Annual Return</h4>**", unsafe_allow_html=True)
+heatmap_horizon = st.slider("Years of Saving", min_value=0, max_value=int(what_if_horizons[-1]), value=fire_horizon, key="what_if_horizon")
+grid_savings_rates, grid_annual_returns = np.meshgrid(what_if_savings_rates, what_if_annual_returns, indexing='ij')
+heatmap_df = pd.DataFrame({
+    'Savings Rate (%)': grid_savings_rates.ravel(),
+    'Annual Return (%)': grid_annual_returns.ravel(),
+    'Savings': what_if_savings[:, :, heatmap_horizon].ravel(),
+})
+heatmap_df['Reaches FIRE Number'] = heatmap_df['Savings'] >= fire_number
+heatmap = alt.Chart(heatmap_df).mark_rect().encode(
+    x=alt.X('Annual Return (%):O', axis=alt.Axis(values=[float(x) for x in range(16)], labelAngle=0)),
+    y=alt.Y('Savings Rate (%):O', sort='descending', axis=alt.Axis(values=[float(x) for x in range(0, 101, 10)])),
+    color=alt.Color('Savings:Q', scale=alt.Scale(scheme='oranges')),
+    tooltip=['Savings Rate (%):Q', 'Annual Return (%):Q', alt.Tooltip('Savings:Q', format='$,.0f'), 'Reaches FIRE Number:N']
+).properties(
+    title=f'Savings after {heatmap_horizon} years (inflation-adjusted)',
+    height=400
+)
+st.altair_chart(heatmap, use_container_width=True)
+
 # Provide suggestions based on risk tolerance
 st.markdown("### Suggestions Based on Risk Tolerance")
 
@@ -441,86 +311,334 @@ This calculator allows you to also simulate outcomes where you add additional in
 """, unsafe_allow_html=True)
 
 
+import os
+
 import numpy as np
 import altair as alt
 
-# Gather user inputs
-col1, col2 = st.columns(2)
+from utils.assets import DEFAULT_CUSTOM_EQUITY_CORRELATION, add_custom_assets, covariance_matrix, default_correlation_matrix
+from utils.decumulation import TERMINAL_PERCENTILES, WithdrawalRule, run_lifecycle
+from utils.glide_path import hold_final_allocation, linear_glide_path, rank_glide_paths
+from utils.historical import allocation_weights, load_history, replay_cohorts
+from utils.path_statistics import PATH_PERCENTILES, drawdown_percentiles, fire_year_percentiles, path_statistics
+from utils.result_cache import ResultCache, iter_monte_carlo_cached
+from utils.return_models import BlockBootstrapReturns, CorrelatedNormalReturns, GarchReturns, NormalReturns, RegimeSwitchingReturns, StudentTReturns, regime_covariances
+from utils.simulation import PARALLEL_MIN_TRIALS
+from utils.solver import simulate_savings_response
+from utils.variance_reduction import SAMPLING_METHODS
+
+# Monte Carlo results are kept in an on-disk cache shared by all sessions, so common
+# inputs are simulated once and widget changes elsewhere on the page are cache hits. The
+# drawdown simulation is cached per server. Return models are hashed by their parameters,
+# and results do not depend on the number of workers, so it is left out of the key.
+RETURN_MODEL_HASH_FUNCS = {model: vars for model in (NormalReturns, CorrelatedNormalReturns, BlockBootstrapReturns, StudentTReturns, RegimeSwitchingReturns, GarchReturns)}
+
+
+@st.cache_resource
+def get_result_cache():
+    return ResultCache()
+
+
+def percentile_chart(percentiles, first_age):
+    # 10th/50th/90th percentile lines, one point per year from first_age
+    years = percentiles.shape[1]
+    percentile_df = pd.DataFrame({
+        'Year': list(range(first_age, first_age + years)) * 3,
+        'Total Savings': np.concatenate([percentiles[0], percentiles[1], percentiles[2]]),
+        'Percentile': ['10th'] * years + ['50th'] * years + ['90th'] * years
+    })
+    return alt.Chart(percentile_df).mark_line().encode(
+        x=alt.X('Year', title='Year', scale=alt.Scale(domain=[first_age, first_age + years - 1])),
+        y=alt.Y('Total Savings', title='Total Savings'),
+        color=alt.Color('Percentile', legend=alt.Legend(orient='bottom'))
+    ).properties(
+        title='Monte Carlo Simulation of Retirement Savings',
+        width=800,  # Increase the width of the chart
+        height=400  # Increase the height of the chart
+    )
+
+
+@st.cache_data(show_spinner="Simulating retirement...", hash_funcs=RETURN_MODEL_HASH_FUNCS, max_entries=20)
+def cached_lifecycle(current_savings, annual_savings, accumulation_years, retirement_years, annual_spending, withdrawal_rule, weights, return_model, inflation_rate, num_trials, seed, _workers):
+    return run_lifecycle(
+        current_savings, annual_savings, accumulation_years, retirement_years, annual_spending, withdrawal_rule,
+        weights, return_model, inflation_rate, num_trials, seed=seed, workers=_workers,
+    )
+
+
+@st.cache_data(show_spinner="Comparing glide paths...", hash_funcs=RETURN_MODEL_HASH_FUNCS, max_entries=20)
+def cached_glide_path_ranking(current_savings, annual_savings, glide_paths, return_model, inflation_rate, num_trials, target, periods_per_year):
+    # Fixed seed, so the ranking does not change between reruns
+    return rank_glide_paths(current_savings, annual_savings, glide_paths, return_model, inflation_rate, num_trials, target, seed=0, periods_per_year=periods_per_year)
+
+
+@st.cache_data(show_spinner="Solving for your savings...", hash_funcs=RETURN_MODEL_HASH_FUNCS, max_entries=20)
+def cached_savings_response(current_savings, years, weights, return_model, inflation_rate, num_trials, seed, periods_per_year, _workers):
+    return simulate_savings_response(
+        current_savings, years, weights, return_model, inflation_rate, num_trials,
+        seed=seed, workers=_workers, periods_per_year=periods_per_year,
+    )
 
-with col1:
-    stable_assets_percentage = st.number_input("% of Stable Assets", min_value=0.0, max_value=100.0, value=85.0, step=0.1, key="stable_assets_percentage")
-    stable_annual_return = st.number_input("Stable Assets Annual Return (%)", min_value=0.0, value=7.0, step=0.1, key="stable_annual_return")
-    stable_standard_deviation = st.number_input("Stable Assets Standard Deviation (%)", min_value=0.0, value=10.0, step=0.1, key="stable_standard_deviation")
-    current_age = age
-    current_savings = current_savings
 
-with col2:
-    growth_assets_percentage = st.number_input("% of Growth Assets", min_value=0.0, max_value=100.0, value=15.0, step=0.1, key="growth_assets_percentage")
-    growth_annual_return = st.number_input("Growth Assets Annual Return (%)", min_value=0.0, value=15.0, step=0.1, key="growth_annual_return")
-    growth_standard_deviation = st.number_input("Growth Assets Standard Deviation (%)", min_value=0.0, value=30.0, step=0.1, key="growth_standard_deviation")
-    annual_savings = annual_income * (savings_rate / 100)
- 
+# Gather user inputs
+simulation_model = st.radio(
+    "Simulation Model",
+    ["Stable and Growth Assets", "Full Allocation (Correlated)", "Historical (Block Bootstrap)", "Historical (Cohort Replay)"],
+    horizontal=True,
+    key="simulation_model",
+    help="Full Allocation simulates every asset type and custom asset from the left side panel, with correlated returns. Historical Block Bootstrap resamples blocks of real past returns for the same allocation, and Cohort Replay runs your plan from every historical start year.",
+)
+annual_savings = annual_income * (savings_rate / 100)
+current_age = age
+simulation_periods_per_year = periods_per_year
+if desired_fire_age <= current_age:
+    st.info("Set a desired FIRE age after your current age to simulate your savings until FIRE.")
+    st.stop()
+
+if simulation_model == "Stable and Growth Assets":
+    col1, col2 = st.columns(2)
+
+    with col1:
+        stable_assets_percentage = st.number_input("% of Stable Assets", min_value=0.0, max_value=100.0, value=85.0, step=0.1, key="stable_assets_percentage")
+        stable_annual_return = st.number_input("Stable Assets Annual Return (%)", min_value=0.0, value=7.0, step=0.1, key="stable_annual_return")
+        stable_standard_deviation = st.number_input("Stable Assets Standard Deviation (%)", min_value=0.0, value=10.0, step=0.1, key="stable_standard_deviation")
+
+    with col2:
+        growth_assets_percentage = st.number_input("% of Growth Assets", min_value=0.0, max_value=100.0, value=15.0, step=0.1, key="growth_assets_percentage")
+        growth_annual_return = st.number_input("Growth Assets Annual Return (%)", min_value=0.0, value=15.0, step=0.1, key="growth_annual_return")
+        growth_standard_deviation = st.number_input("Growth Assets Standard Deviation (%)", min_value=0.0, value=30.0, step=0.1, key="growth_standard_deviation")
+
+    simulation_weights = [stable_assets_percentage / 100, growth_assets_percentage / 100]
+    use_glide_path = st.checkbox("Glide path: move from growth to stable assets as you approach FIRE", key="use_glide_path")
+    if use_glide_path:
+        final_growth_percentage = st.number_input(
+            "% of Growth Assets at FIRE Age", min_value=0.0, max_value=stable_assets_percentage + growth_assets_percentage, value=min(5.0, growth_assets_percentage), step=0.1, key="final_growth_percentage",
+            help="The growth share changes in equal steps each year, from the % above now to this % at your desired FIRE age",
+        )
+        allocation_total = (stable_assets_percentage + growth_assets_percentage) / 100
+        simulation_weights = linear_glide_path(
+            simulation_weights, [allocation_total - final_growth_percentage / 100, final_growth_percentage / 100], int(desired_fire_age - current_age),
+        )
+    return_model = NormalReturns(
+        means=[stable_annual_return / 100, growth_annual_return / 100],
+        std_devs=[stable_standard_deviation / 100, growth_standard_deviation / 100],
+    )
+elif simulation_model == "Full Allocation (Correlated)":
+    st.markdown("<p style='font-size: 16px;'>This simulation uses the allocation, growth rates and volatilities from the left side panel, including custom assets.</p>", unsafe_allow_html=True)
+    with st.expander("Adjust Correlation Assumptions"):
+        st.markdown("<p style='font-size: medium; font-style: italic;'>Edit the upper triangle (above the diagonal); the lower triangle mirrors it.</p>", unsafe_allow_html=True)
+        asset_labels = [label for _, label, _, _ in ASSET_CLASSES]
+        edited_correlations = st.data_editor(
+            pd.DataFrame(default_correlation_matrix(), index=asset_labels, columns=asset_labels),
+            key="asset_correlations",
+        ).to_numpy(dtype=float)
+        custom_equity_correlation = st.number_input("Custom Assets Correlation with Equities", min_value=0.0, max_value=1.0, value=DEFAULT_CUSTOM_EQUITY_CORRELATION, step=0.05, key="custom_equity_correlation")
+
+    asset_correlations = np.triu(edited_correlations, 1)
+    asset_correlations = asset_correlations + asset_correlations.T + np.eye(len(asset_correlations))
+    asset_correlations = add_custom_assets(asset_correlations, portfolio_assets.num_custom, custom_equity_correlation)
+
+    simulation_weights = portfolio_assets.weights
+    return_model = CorrelatedNormalReturns(
+        means=portfolio_assets.growth_rates / 100,
+        covariance=covariance_matrix(portfolio_assets.volatilities / 100, asset_correlations),
+    )
+else:
+    try:
+        return_history = load_history()
+    except FileNotFoundError:
+        st.info("No historical returns file found. Build one from a CSV of annual (or monthly) returns per asset type with `python -m utils.historical build returns.csv`.")
+        st.stop()
+
+    simulation_weights, missing_assets = allocation_weights(return_history, portfolio_assets.history_keys, portfolio_assets.allocations)
+    if missing_assets:
+        st.warning(f"The historical returns file has no data for: {', '.join(missing_assets)}. These allocations are left out of the simulation.")
+
+    if simulation_model == "Historical (Block Bootstrap)":
+        block_years = st.number_input("Block Length (years)", min_value=1, max_value=max(1, return_history.num_years), value=min(5, max(1, return_history.num_years)), step=1, key="block_years", help="Consecutive historical years resampled together, which keeps runs of good and bad years")
+        st.markdown(f"<p style='font-size: 16px;'>Resampling {return_history.num_years} years of history starting {return_history.start_period} for the allocation on the left side panel. Custom assets follow equities history.</p>", unsafe_allow_html=True)
+        return_model = BlockBootstrapReturns(return_history.returns, return_history.periods_per_year, block_years)
+        if periods_per_year != return_history.periods_per_year:
+            simulation_periods_per_year = 1
+            if return_history.periods_per_year == 1:
+                st.caption("The returns history is annual, so this simulation steps yearly.")
+            else:
+                st.caption(f"Monthly steps are off, so this simulation steps yearly, compounding {return_history.periods_per_year} periods of history into each year.")
+    else:
+        st.markdown(f"<p style='font-size: 16px;'>Replaying your plan from every start year in {return_history.num_years} years of history starting {return_history.start_period}, using the allocation on the left side panel. Custom assets follow equities history.</p>", unsafe_allow_html=True)
+
+# Fat-tailed and clustered alternatives to normal returns, with the same means and covariance
+if simulation_model in ("Stable and Growth Assets", "Full Allocation (Correlated)"):
+    return_distribution = st.selectbox(
+        "Return Distribution",
+        ["normal", "student_t", "regime_switching", "garch"],
+        format_func={"normal": "Normal", "student_t": "Fat Tails (Student-t)", "regime_switching": "Calm and Crash Regimes", "garch": "Volatility Clustering (GARCH)"}.get,
+        key="return_distribution",
+        help="Normal returns understate crash risk. The other models keep the same average returns and volatilities but make extreme or back-to-back bad years more likely. In the regime model, a crash gap larger than an asset's volatility raises that asset's volatility.",
+    )
+    model_means = return_model.means
+    model_covariance = return_model.covariance if hasattr(return_model, "covariance") else np.diag(return_model.std_devs ** 2)
+    if return_distribution == "student_t":
+        degrees_of_freedom = st.number_input("Degrees of Freedom", min_value=2.5, max_value=100.0, value=5.0, step=0.5, key="degrees_of_freedom", help="Lower values mean fatter tails; around 30 is close to normal")
+        return_model = StudentTReturns(model_means, model_covariance, degrees_of_freedom)
+    elif return_distribution == "regime_switching":
+        col1, col2 = st.columns(2)
+        with col1:
+            crash_probability = st.number_input("Chance a Calm Year Is Followed by a Crash Year (%)", min_value=0.0, max_value=100.0, value=10.0, step=1.0, key="crash_probability")
+            crash_persistence = st.number_input("Chance a Crash Year Is Followed by Another (%)", min_value=0.0, max_value=99.0, value=30.0, step=1.0, key="crash_persistence")
+        with col2:
+            crash_return_shift = st.number_input("Crash Year Return vs. Calm Year (%)", max_value=0.0, value=-20.0, step=1.0, key="crash_return_shift")
+            crash_volatility_multiplier = st.number_input("Crash Year Volatility Multiplier", min_value=1.0, value=2.0, step=0.1, key="crash_volatility_multiplier")
+        # Calm and crash means and covariances are set so the long-run average returns and
+        # volatilities stay at the inputs above
+        crash_share = (crash_probability / 100) / (crash_probability / 100 + 1 - crash_persistence / 100)
+        regime_means = [model_means - crash_share * crash_return_shift / 100, model_means + (1 - crash_share) * crash_return_shift / 100]
+        regime_transition = [[1 - crash_probability / 100, crash_probability / 100], [1 - crash_persistence / 100, crash_persistence / 100]]
+        return_model = RegimeSwitchingReturns(
+            means=regime_means,
+            covariances=regime_covariances(model_covariance, regime_means, regime_transition, [1, crash_volatility_multiplier]),
+            transition=regime_transition,
+        )
+    elif return_distribution == "garch":
+        col1, col2 = st.columns(2)
+        with col1:
+            garch_alpha = st.number_input("Shock Impact (alpha)", min_value=0.0, max_value=0.99, value=0.1, step=0.01, key="garch_alpha", help="How much a large move raises next year's volatility")
+        with col2:
+            garch_beta = st.number_input("Volatility Persistence (beta)", min_value=0.0, max_value=0.99, value=0.85, step=0.01, key="garch_beta", help="How slowly raised volatility fades; alpha + beta must be below 1")
+        if garch_alpha + garch_beta >= 1:
+            st.error("Shock impact plus volatility persistence must be below 1.")
+            st.stop()
+        return_model = GarchReturns(model_means, model_covariance, garch_alpha, garch_beta)
+    if not hasattr(return_model, "per_period"):
+        simulation_periods_per_year = 1
+        if periods_per_year != 1:
+            st.caption("This return distribution is simulated in yearly steps.")
+
+    # Rank straight-line glide paths ending at different growth shares, all simulated on the same returns
+    if simulation_model == "Stable and Growth Assets" and use_glide_path:
+        with st.expander("Compare Glide Paths"):
+            final_growth_options = np.linspace(0, 1, 11) * (stable_assets_percentage + growth_assets_percentage)
+            glide_path_ranking = cached_glide_path_ranking(
+                current_savings, annual_savings,
+                glide_paths=linear_glide_path(simulation_weights[0], np.stack([allocation_total - final_growth_options / 100, final_growth_options / 100], axis=1), len(simulation_weights)),
+                return_model=return_model,
+                inflation_rate=inflation_rate / 100,
+                num_trials=10_000,
+                target=fire_number,
+                periods_per_year=simulation_periods_per_year,
+            )
+            st.dataframe(pd.DataFrame({
+                'Growth Assets at FIRE Age': [f"{final_growth_options[i]:.0f}%" for i in glide_path_ranking.order],
+                'Chance of Reaching FIRE Number': [f"{glide_path_ranking.success_probability[i]:.1%}" for i in glide_path_ranking.order],
+                'Median Savings at FIRE Age': [f"${glide_path_ranking.median_final_savings[i]:,.0f}" for i in glide_path_ranking.order],
+            }), hide_index=True)
+            st.caption(f"Each glide path starts at {growth_assets_percentage:.0f}% growth assets today and is simulated on the same {glide_path_ranking.num_trials:,} market paths.")
+
 # Add line breaks for better spacing
 st.markdown("<br><br>", unsafe_allow_html=True)
 
 
-
-# Monte Carlo simulation parameters
-num_trials = 1000
 years = int(desired_fire_age - current_age)
 inflation_rate = inflation_rate / 100
 
 # # Print the number of years until desired FIRE age in Streamlit
 # st.markdown(f"<h3 style='font-size: 18px;'>Years until desired FIRE age: {years}</h3>", unsafe_allow_html=True)
 
-
-# Run Monte Carlo simulation
-results = []
-
-for _ in range(num_trials):
-    total_savings = current_savings
-    savings_over_time = []
-
-    for year in range(years):
-        stable_return = np.random.normal(stable_annual_return / 100, stable_standard_deviation / 100)
-        growth_return = np.random.normal(growth_annual_return / 100, growth_standard_deviation / 100)
-        adjusted_annual_return = (stable_assets_percentage / 100 * stable_return) + (growth_assets_percentage / 100 * growth_return) - inflation_rate
-        total_savings = total_savings * (1 + adjusted_annual_return) + annual_savings
-        savings_over_time.append(total_savings)
-
-    results.append(savings_over_time)
-
-# Calculate percentiles
-results = np.array(results)
-percentiles = np.percentile(results, [10, 50, 90], axis=0)
-
-# Create DataFrame for plotting
-
-years_range = list(range(int(current_age) + 1, int(desired_fire_age) + 1))
-percentile_df = pd.DataFrame({
-    'Year': years_range * 3,
-    'Total Savings': np.concatenate([percentiles[0], percentiles[1], percentiles[2]]),
-    'Percentile': ['10th'] * years + ['50th'] * years + ['90th'] * years
-})
-
-# Plot the results using Altair
-chart = alt.Chart(percentile_df).mark_line().encode(
-    x=alt.X('Year', title='Year', scale=alt.Scale(domain=[int(current_age) + 1, int(desired_fire_age)])),
-    y=alt.Y('Total Savings', title='Total Savings'),
-    color=alt.Color('Percentile', legend=alt.Legend(orient='bottom'))
-).properties(
-    title='Monte Carlo Simulation of Retirement Savings',
-    width=800,  # Increase the width of the chart
-    height=400  # Increase the height of the chart
-)
-
-st.altair_chart(chart, use_container_width=True)
+if simulation_model == "Historical (Cohort Replay)":
+    # Replay every historical start year and calculate percentiles across cohorts
+    if years > return_history.num_years:
+        st.warning(f"The returns history covers {return_history.num_years} years, fewer than the {years} years until your desired FIRE age.")
+        st.stop()
+    cohort_replay = replay_cohorts(return_history, simulation_weights, current_savings, annual_savings, years, inflation_rate, fire_number)
+    percentiles = cohort_replay.percentiles
+    percentile_half_width = None
+    fire_year_counts, drawdown_counts = path_statistics(cohort_replay.savings_by_year, current_savings, fire_number)
+    worst_start_year, worst_final_savings = cohort_replay.worst_cohort
+    st.markdown(f"<h3 style='font-size: 18px;'>Historical success rate: {cohort_replay.success_rate:.0%} of {len(cohort_replay.start_years)} start years reach your FIRE number by {desired_fire_age}</h3>", unsafe_allow_html=True)
+    st.markdown(f"<p style='font-size: 16px;'>Worst cohort: starting in {worst_start_year}, you would have ${worst_final_savings:,.2f} at age {desired_fire_age}.</p>", unsafe_allow_html=True)
+    percentile_chart_placeholder = st.empty()
+else:
+    # Monte Carlo simulation parameters
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        num_trials = int(st.number_input("Number of Simulations", min_value=100, max_value=10_000_000, value=1000, step=1000, key="num_trials"))
+    with col2:
+        seed = st.number_input("Random Seed (leave blank for a new run)", min_value=0, value=None, step=1, key="simulation_seed", help="Enter the seed shown below a previous run to reproduce it exactly")
+    with col3:
+        workers = int(st.number_input(
+            "Parallel Workers", min_value=1, max_value=os.cpu_count() or 1, value=1, step=1, key="simulation_workers",
+            disabled=num_trials < PARALLEL_MIN_TRIALS,
+            help=f"Run from {PARALLEL_MIN_TRIALS:,} simulations upwards in several processes; smaller runs use one",
+        ))
+    if num_trials < PARALLEL_MIN_TRIALS:
+        workers = 1
+
+    # Variance reduction only applies to the normal-distribution models with fixed weights
+    gaussian_model = hasattr(return_model, "portfolio_from_normals") and np.ndim(simulation_weights) == 1
+    col1, col2 = st.columns(2)
+    with col1:
+        sampling = st.selectbox(
+            "Sampling Method",
+            SAMPLING_METHODS,
+            format_func={"random": "Random", "antithetic": "Antithetic Pairs", "sobol": "Quasi-Random (Sobol)"}.get,
+            disabled=not gaussian_model,
+            key="sampling_method",
+            help="Antithetic pairs and Sobol points spread the trials more evenly, giving steadier percentiles with fewer trials",
+        )
+        precision_target = st.number_input(
+            "Stop Early at Precision (±%)", min_value=0.0, max_value=10.0, value=0.5, step=0.1, key="precision_target",
+            help="Stop once every percentile is known to within this % at 95% confidence, instead of running every trial. 0 runs them all.",
+        )
+    with col2:
+        streaming_mode = st.checkbox("Streaming mode (constant memory, approximate percentiles)", value=num_trials > 100_000, key="streaming_mode")
+        control_variate = st.checkbox(
+            "Use control variates",
+            disabled=not gaussian_model or streaming_mode,
+            key="control_variate",
+            help="Corrects each percentile using how far every trial strays from the deterministic projection above",
+        )
+        single_precision = st.checkbox("Low-memory mode (float32)", key="single_precision", help="Stores simulated savings in single precision, halving memory; percentiles move by a few dollars at most")
+
+    new_random_run = seed is None and st.button("New Random Run", key="simulation_rerun")
+
+    # Run Monte Carlo simulation, redrawing the chart as the percentiles are refined
+    simulation_status = st.empty()
+    percentile_chart_placeholder = st.empty()
+    for simulation_result in iter_monte_carlo_cached(
+        get_result_cache(), current_savings, annual_savings, years,
+        weights=simulation_weights,
+        return_model=return_model,
+        inflation_rate=inflation_rate,
+        num_trials=num_trials,
+        seed=None if seed is None else int(seed),
+        workers=workers,
+        reuse_any_seed=not new_random_run,
+        streaming=streaming_mode,
+        sampling=sampling if gaussian_model else "random",
+        control_variate=control_variate and gaussian_model and not streaming_mode,
+        tolerance=precision_target / 100 if precision_target > 0 else None,
+        periods_per_year=simulation_periods_per_year,
+        dtype="float32" if single_precision else "float64",
+        target=fire_number,
+    ):
+        simulation_status.caption(f"Refining: {simulation_result.num_trials:,} of {num_trials:,} trials so far...")
+        percentile_chart_placeholder.altair_chart(percentile_chart(simulation_result.percentiles, int(current_age) + 1), use_container_width=True)
+    percentiles = simulation_result.percentiles
+    percentile_half_width = simulation_result.confidence_half_width
+    fire_year_counts, drawdown_counts = simulation_result.fire_year_counts, simulation_result.drawdown_counts
+    simulation_status.caption(f"Seed: {simulation_result.seed} (enter it above to reproduce this run)")
+    if simulation_result.num_trials < num_trials:
+        st.caption(f"Stopped after {simulation_result.num_trials:,} of {num_trials:,} trials: every percentile was within ±{precision_target:.1f}% at 95% confidence.")
+    if streaming_mode:
+        st.caption(f"Percentiles are estimated from streaming sketches: each is within ±{simulation_result.error_bound:.1%} of the exact value (largest gap measured on the first batch: {simulation_result.observed_error:.2%}).")
+
+percentile_chart_placeholder.altair_chart(percentile_chart(percentiles, int(current_age) + 1), use_container_width=True)
 
 # Display final savings percentiles at desired FIRE age
 st.markdown(f"<h3 style='font-size: 18px;'>Projected Savings at Age {desired_fire_age}</h3>", unsafe_allow_html=True)
-st.markdown(f"<p style='font-size: 18px;'>10th Percentile: ${percentiles[0, -1]:,.2f}</p>", unsafe_allow_html=True)
-st.markdown(f"<p style='font-size: 18px;'>50th Percentile (Median): ${percentiles[1, -1]:,.2f}</p>", unsafe_allow_html=True)
-st.markdown(f"<p style='font-size: 18px;'>90th Percentile: ${percentiles[2, -1]:,.2f}</p>", unsafe_allow_html=True)
+for i, percentile_label in enumerate(["10th Percentile", "50th Percentile (Median)", "90th Percentile"]):
+    confidence_note = "" if percentile_half_width is None else f" <span style='font-size: 14px; color: gray;'>(± ${percentile_half_width[i, -1]:,.0f} at 95% confidence)</span>"
+    st.markdown(f"<p style='font-size: 18px;'>{percentile_label}: ${percentiles[i, -1]:,.2f}{confidence_note}</p>", unsafe_allow_html=True)
 st.markdown("<div style='padding: 20px;'></div>", unsafe_allow_html=True)
 
 # Reflection
@@ -530,4 +648,167 @@ st.markdown(f"""
     <li>The 10th percentile outcome represents a more worst-case scenario, where returns are lower than average.</li>
     <li>The 90th percentile outcome represents a more best-case scenario, where returns are higher than average.</li>
 </ul>
-""", unsafe_allow_html=True)
\ No newline at end of file
+""", unsafe_allow_html=True)
+
+# When each simulated path first reaches the FIRE number, and its worst fall along the way
+st.markdown("<h3 style='font-size: 18px;'>When Could You Reach Your FIRE Number?</h3>", unsafe_allow_html=True)
+fire_year_share = fire_year_counts / fire_year_counts.sum()
+st.markdown(f"<p style='font-size: 16px;'>{1 - fire_year_share[-1]:.0%} of the simulated paths reach your FIRE number of ${fire_number:,.0f} by age {desired_fire_age}.</p>", unsafe_allow_html=True)
+fire_age_df = pd.DataFrame({
+    'Age': int(current_age) + np.arange(len(fire_year_share) - 1),
+    'Reach FIRE Number That Year': fire_year_share[:-1],
+    'Reached by Then': np.cumsum(fire_year_share[:-1]),
+})
+fire_age_bars = alt.Chart(fire_age_df).mark_bar(color='#F39373').encode(
+    x=alt.X('Age:O', title='Age'),
+    y=alt.Y('Reach FIRE Number That Year:Q', axis=alt.Axis(format='%')),
+    tooltip=['Age:O', alt.Tooltip('Reach FIRE Number That Year:Q', format='.1%'), alt.Tooltip('Reached by Then:Q', format='.1%')]
+)
+fire_age_line = alt.Chart(fire_age_df).mark_line(color='gray').encode(
+    x='Age:O',
+    y=alt.Y('Reached by Then:Q', axis=alt.Axis(format='%'))
+)
+st.altair_chart(alt.layer(fire_age_bars, fire_age_line).resolve_scale(y='independent').properties(title='Age at Which Savings First Reach Your FIRE Number', height=300), use_container_width=True)
+st.dataframe(pd.DataFrame({
+    'Percentile': [f"{p}th" for p in PATH_PERCENTILES],
+    'FIRE Age': [f"after {desired_fire_age}" if years == np.inf else f"{int(current_age + years)}" for years in fire_year_percentiles(fire_year_counts)],
+    'Largest Fall in Savings': [f"{drawdown:.1%}" for drawdown in drawdown_percentiles(drawdown_counts)],
+}), hide_index=True)
+# Add a divider
+st.markdown("<hr>", unsafe_allow_html=True)
+
+
+# Inverse solver: the savings rate and FIRE age for a chosen chance of success
+st.markdown("<h2 style='color: #F39373;'>Optional: What Would It Take?</h2>", unsafe_allow_html=True)
+
+st.markdown("""
+Instead of guessing a savings rate and rerunning the simulation, pick how sure you want to be. This section finds the savings rate that reaches your FIRE number by your desired age with that chance, and the earliest age your current savings rate gets there with that chance. Every answer is worked out on the same simulated market paths.
+""", unsafe_allow_html=True)
+
+if simulation_model == "Historical (Cohort Replay)":
+    st.info("Choose one of the simulated models above to solve for a savings rate or FIRE age.")
+else:
+    col1, col2 = st.columns(2)
+    with col1:
+        target_probability = st.slider("Chance of Reaching Your FIRE Number (%)", min_value=50, max_value=99, value=90, step=1, key="target_probability")
+    with col2:
+        solver_trials = int(st.number_input("Simulated Paths", min_value=1000, max_value=1_000_000, value=10_000, step=1000, key="solver_trials"))
+
+    # Search for a FIRE age up to 100
+    solver_years = max(years, 100 - int(current_age))
+    savings_response = cached_savings_response(
+        current_savings, solver_years,
+        weights=hold_final_allocation(simulation_weights, solver_years),
+        return_model=return_model,
+        inflation_rate=inflation_rate,
+        num_trials=solver_trials,
+        seed=simulation_result.seed,
+        periods_per_year=simulation_periods_per_year,
+        _workers=workers,
+    )
+    required_savings = savings_response.required_annual_savings(fire_number, target_probability / 100, years)
+    years_needed = savings_response.years_to_target(annual_savings, fire_number, target_probability / 100)
+
+    if required_savings == float('inf'):
+        st.markdown(f"<p style='font-size: 16px;'>No savings rate reaches your FIRE number by age {desired_fire_age} in {target_probability}% of the simulated paths.</p>", unsafe_allow_html=True)
+    elif required_savings <= 0:
+        st.markdown(f"<p style='font-size: 16px;'>Your current savings alone reach your FIRE number by age {desired_fire_age} in {target_probability}% of the simulated paths.</p>", unsafe_allow_html=True)
+    else:
+        required_rate = f" ({required_savings / annual_income:.1%} of your income)" if annual_income > 0 else ""
+        st.markdown(f"<h3 style='font-size: 18px;'>Save ${required_savings:,.0f} a year{required_rate} for a {target_probability}% chance of reaching FIRE by age {desired_fire_age}.</h3>", unsafe_allow_html=True)
+    if years_needed == float('inf'):
+        st.markdown(f"<p style='font-size: 16px;'>At your current savings rate of {savings_rate}%, fewer than {target_probability}% of the simulated paths reach your FIRE number by age {int(current_age) + solver_years}.</p>", unsafe_allow_html=True)
+    else:
+        st.markdown(f"<p style='font-size: 16px;'>At your current savings rate of {savings_rate}%, you have a {target_probability}% chance of reaching FIRE by age {int(current_age + years_needed)}.</p>", unsafe_allow_html=True)
+# Add a divider
+st.markdown("<hr>", unsafe_allow_html=True)
+
+
+#Retirement drawdown simulation
+st.markdown("<h2 style='color: #F39373;'>Optional: Will Your Money Last?</h2>", unsafe_allow_html=True)
+
+st.markdown("""
+Reaching your FIRE number is only half the plan. This section keeps simulating after your desired FIRE age, withdrawing your retirement spending each year (adjusted for inflation), to see how likely it is that your money runs out and what you might leave behind.
+""", unsafe_allow_html=True)
+
+if simulation_model == "Historical (Cohort Replay)":
+    st.info("Choose one of the simulated models above to run the retirement drawdown simulation.")
+else:
+    col1, col2 = st.columns(2)
+    with col1:
+        plan_until_age = st.number_input("Plan Until Age", min_value=int(desired_fire_age) + 1, max_value=120, value=max(95, int(desired_fire_age) + 1), step=1, key="plan_until_age")
+        retirement_spending = st.number_input("Annual Spending in Retirement ($, today's money)", min_value=0, value=int(annual_expenses), step=1000, key="retirement_spending")
+    with col2:
+        withdrawal_kind = st.selectbox(
+            "Withdrawal Rule",
+            ["constant", "guardrails", "variable"],
+            format_func={"constant": "Constant (inflation-adjusted)", "guardrails": "Guardrails", "variable": "Variable (% of portfolio)"}.get,
+            key="withdrawal_kind",
+            help="Guardrails cut spending after bad years and raise it after good ones. Variable spends a fixed % of the portfolio, within a floor and ceiling.",
+        )
+        if withdrawal_kind == "guardrails":
+            guardrail_band = st.number_input("Guardrail Band (%)", min_value=1.0, max_value=100.0, value=20.0, step=1.0, key="guardrail_band", help="How far the withdrawal rate can drift from its starting value before spending is adjusted")
+            guardrail_adjustment = st.number_input("Spending Adjustment (%)", min_value=1.0, max_value=100.0, value=10.0, step=1.0, key="guardrail_adjustment")
+            withdrawal_rule = WithdrawalRule("guardrails", band=guardrail_band / 100, adjustment=guardrail_adjustment / 100)
+        elif withdrawal_kind == "variable":
+            variable_rate = st.number_input("Withdrawal Rate (% of portfolio)", min_value=0.1, max_value=100.0, value=4.0, step=0.1, key="variable_rate")
+            spending_floor = st.number_input("Spending Floor (% of spending)", min_value=0.0, max_value=100.0, value=80.0, step=5.0, key="spending_floor")
+            spending_ceiling = st.number_input("Spending Ceiling (% of spending)", min_value=100.0, max_value=1000.0, value=150.0, step=5.0, key="spending_ceiling")
+            withdrawal_rule = WithdrawalRule("variable", variable_rate=variable_rate / 100, floor=spending_floor / 100, ceiling=spending_ceiling / 100)
+        else:
+            withdrawal_rule = WithdrawalRule()
+
+    retirement_years = int(plan_until_age - desired_fire_age)
+    lifecycle_result = cached_lifecycle(
+        current_savings, annual_savings, years, retirement_years,
+        annual_spending=retirement_spending,
+        withdrawal_rule=withdrawal_rule,
+        weights=hold_final_allocation(simulation_weights, years + retirement_years),
+        return_model=return_model,
+        inflation_rate=inflation_rate,
+        num_trials=simulation_result.num_trials,
+        seed=simulation_result.seed,
+        _workers=workers,
+    )
+
+    st.markdown(f"<h3 style='font-size: 18px;'>Chance your money lasts until age {plan_until_age}: {lifecycle_result.success_rate:.1%}</h3>", unsafe_allow_html=True)
+
+    # Probability of running out of money by each age
+    depletion_df = pd.DataFrame({
+        'Age': np.arange(int(desired_fire_age) + 1, int(plan_until_age) + 1),
+        'Probability of Running Out': lifecycle_result.depletion_probability,
+    })
+    depletion_chart = alt.Chart(depletion_df).mark_line(color='red').encode(
+        x=alt.X('Age:Q', title='Age', scale=alt.Scale(domain=[int(desired_fire_age) + 1, int(plan_until_age)])),
+        y=alt.Y('Probability of Running Out:Q', axis=alt.Axis(format='%')),
+        tooltip=['Age:Q', alt.Tooltip('Probability of Running Out:Q', format='.1%')]
+    ).properties(
+        title='Probability of Running Out of Money by Age',
+        height=300
+    )
+    st.altair_chart(depletion_chart, use_container_width=True)
+
+    # Wealth over accumulation and retirement
+    lifecycle_ages = list(range(int(current_age) + 1, int(plan_until_age) + 1))
+    lifecycle_df = pd.DataFrame({
+        'Year': lifecycle_ages * 3,
+        'Total Savings': lifecycle_result.percentiles.ravel(),
+        'Percentile': ['10th'] * len(lifecycle_ages) + ['50th'] * len(lifecycle_ages) + ['90th'] * len(lifecycle_ages)
+    })
+    lifecycle_chart = alt.Chart(lifecycle_df).mark_line().encode(
+        x=alt.X('Year', title='Age', scale=alt.Scale(domain=[int(current_age) + 1, int(plan_until_age)])),
+        y=alt.Y('Total Savings', title='Total Savings'),
+        color=alt.Color('Percentile', legend=alt.Legend(orient='bottom'))
+    ).properties(
+        title='Savings Before and After FIRE',
+        height=400
+    )
+    st.altair_chart(lifecycle_chart, use_container_width=True)
+
+    # Distribution of what is left at the end of the plan
+    st.markdown(f"<h3 style='font-size: 18px;'>Savings Left at Age {plan_until_age}</h3>", unsafe_allow_html=True)
+    terminal_df = pd.DataFrame({
+        'Percentile': [f"{p}th" for p in TERMINAL_PERCENTILES],
+        'Savings Left': [f"${value:,.0f}" for value in lifecycle_result.terminal_percentiles],
+    })
+    st.dataframe(terminal_df, hide_index=True)
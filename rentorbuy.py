@@ -4,8 +4,30 @@ import matplotlib.pyplot as plt
 import numpy as np  # Added this line
 import pandas as pd
 import altair as alt
+import io
 
 from utils.currencies import get_currency_list, get_currency_symbol
+from utils.rent_vs_buy import break_even_mortgage_rates, calculate_rent_vs_buy, iter_batch, sweep_rent_vs_buy
+
+# Rows of the upload shown on the page; the download has every row
+PREVIEW_ROWS = 1000
+
+
+@st.cache_data(show_spinner="Evaluating every row...", max_entries=4)
+def cached_batch_results(upload, assumptions):
+    # The uploaded CSV evaluated chunk by chunk (the same path as python -m utils.rent_vs_buy)
+    # and encoded for download once per upload and set of assumptions, so reruns reuse it.
+    # Returns (first PREVIEW_ROWS results, rows where buying wins, total rows, results CSV).
+    columns = list(pd.read_csv(io.BytesIO(upload), nrows=0).columns)
+    output = io.StringIO()
+    preview, buy_count, num_rows = None, 0, 0
+    for results in iter_batch(io.BytesIO(upload), assumptions, keep_columns=columns):
+        results.to_csv(output, header=not num_rows, index=False)
+        if preview is None:
+            preview = results.head(PREVIEW_ROWS)
+        buy_count += int((results["Decision"] == "Buy").sum())
+        num_rows += len(results)
+    return preview, buy_count, num_rows, output.getvalue()
 
 #Heading
 st.markdown("<h1 style='color: #F39373; padding-bottom: 30px;'>🏠 Rent vs. Buy Calculator</h1>", unsafe_allow_html=True)
@@ -46,7 +68,8 @@ uploaded_file = st.file_uploader("", type=["csv"])
 
 if uploaded_file is not None:
     try:
-        data = pd.read_csv(uploaded_file)
+        # Only the preview is read here; every row is evaluated in chunks below
+        data = pd.read_csv(uploaded_file, nrows=PREVIEW_ROWS)
         if data.empty:
             st.error("The uploaded CSV file is empty. Please upload a valid file.")
         else:
@@ -60,40 +83,6 @@ if uploaded_file is not None:
 st.markdown("</div>", unsafe_allow_html=True)
 st.markdown("<hr>", unsafe_allow_html=True)
 
-#Base calculations for rent vs. buy
-def calculate_rent_vs_buy(home_price, monthly_rent, stay_duration, mortgage_rate, down_payment, mortgage_term, investment_return, home_price_growth_rate, rental_growth_rate, cost_of_buying, cost_of_selling, maintenance_cost):
-    # Step 1: Calculate initial costs
-    initial_rent_cost = monthly_rent
-    initial_buy_cost = down_payment * home_price + cost_of_buying * home_price
-
-    # Step 2: Calculate recurring costs
-    annual_recurring_rent = monthly_rent * 12
-    total_recurring_rent = annual_recurring_rent * ((1 - (1 + rental_growth_rate) ** stay_duration) / (1 - (1 + rental_growth_rate)))
-
-    annual_mortgage_payment = (home_price * (1 - down_payment)) * (mortgage_rate / (1 - (1 + mortgage_rate) ** -mortgage_term))
-    annual_maintenance_cost = maintenance_cost * home_price
-    annual_recurring_buy = annual_mortgage_payment + annual_maintenance_cost
-    total_recurring_buy = annual_recurring_buy * stay_duration
-
-    # Step 3: Calculate opportunity costs
-    future_value_rent = annual_recurring_rent * (((1 + investment_return) ** stay_duration - (1 + rental_growth_rate) ** stay_duration) / (investment_return - rental_growth_rate))
-    future_value_buy_initial = initial_buy_cost * (1 + investment_return) ** stay_duration
-    future_value_buy_recurring = (annual_mortgage_payment + annual_maintenance_cost) * (((1 + investment_return) ** stay_duration - 1) / investment_return)
-
-    # Annualize opportunity costs
-    annual_future_value_rent = future_value_rent / stay_duration
-    annual_future_value_buy_recurring = future_value_buy_recurring / stay_duration
-
-    # Step 4: Calculate net proceeds
-    future_home_price = home_price * (1 + home_price_growth_rate) ** stay_duration
-    net_proceeds = future_home_price - cost_of_selling * future_home_price
-
-    # Step 5: Calculate total costs
-    total_renting_cost = initial_rent_cost + total_recurring_rent + future_value_rent
-    total_buying_cost = initial_buy_cost + total_recurring_buy + future_value_buy_initial + future_value_buy_recurring - net_proceeds
-
-    return total_renting_cost, total_buying_cost, initial_rent_cost, initial_buy_cost, annual_future_value_rent, annual_future_value_buy_recurring, net_proceeds, annual_mortgage_payment, annual_maintenance_cost, annual_recurring_rent, total_recurring_rent, annual_recurring_buy, total_recurring_buy, future_value_buy_initial
-
 # Streamlit - Manual Inputs
 
 st.markdown("<h3 style='color: #F39373; padding-bottom: 40px;'>Enter Details Manually</h3>", unsafe_allow_html=True)
@@ -136,6 +125,26 @@ with st.expander("Adjust Other Default Assumptions", expanded=False):
     cost_of_selling = st.slider('Cost of Selling (%)', 0.0, 10.0, 8.0) / 100
     maintenance_cost = st.slider('Maintenance Cost (inclusive of tax, insurance, servicing) (%)', 0.0, 10.0, 2.0) / 100
 
+# Every uploaded row in one vectorized pass, with the assumptions above
+if uploaded_file is not None and not data.empty:
+    st.markdown("<h3 style='color: #F39373;'>Results for Every Row</h3>", unsafe_allow_html=True)
+    try:
+        batch_preview, buy_count, num_rows, batch_csv = cached_batch_results(uploaded_file.getvalue(), dict(
+            investment_return=investment_return, home_price_growth_rate=home_price_growth_rate, rental_growth_rate=rental_growth_rate,
+            cost_of_buying=cost_of_buying, cost_of_selling=cost_of_selling, maintenance_cost=maintenance_cost,
+        ))
+    except ValueError as e:
+        st.error(str(e))
+    else:
+        st.write(f"Buying is more cost-effective for {buy_count:,} of {num_rows:,} rows. The calculations below use the first row.")
+        st.dataframe(batch_preview)
+        st.download_button(
+            label="Download Results CSV",
+            data=batch_csv,
+            file_name='rent_vs_buy_results.csv',
+            mime='text/csv'
+        )
+
 st.markdown("<hr>", unsafe_allow_html=True)
 
 # Streamlit - Decision Calculator
@@ -146,6 +155,7 @@ After uploading or manually entering your details, feel free to tap each of the
 
 - **Calculate Decision**: Calculate total rent vs. buy costs, including opportunity cost
 - **Mortgage Rate - Breakeven**: See the mortgage % that you need in order for renting and buying to cost the same
+- **Break-even Frontier**: See every combination of two inputs at which renting and buying cost the same
 """, unsafe_allow_html=True)
 st.markdown("<div style='padding-bottom: 30px;'></div>", unsafe_allow_html=True)
 
@@ -153,7 +163,11 @@ if st.button("Calculate Decision"):
     currency_symbol = get_currency_symbol(currency)
 
     results = calculate_rent_vs_buy(home_price, monthly_rent, stay_duration, mortgage_rate, down_payment, mortgage_term, investment_return, home_price_growth_rate, rental_growth_rate, cost_of_buying, cost_of_selling, maintenance_cost)
-    total_renting_cost, total_buying_cost, initial_rent_cost, initial_buy_cost, annual_future_value_rent, annual_future_value_buy_recurring, net_proceeds, annual_mortgage_payment, annual_maintenance_cost, annual_recurring_rent, total_recurring_rent, annual_recurring_buy, total_recurring_buy, future_value_buy_initial = results
+    total_renting_cost, total_buying_cost = results.total_renting_cost, results.total_buying_cost
+    initial_rent_cost, initial_buy_cost = results.initial_rent_cost, results.initial_buy_cost
+    total_recurring_rent, total_recurring_buy = results.total_recurring_rent, results.total_recurring_buy
+    annual_future_value_rent, annual_future_value_buy_recurring = results.annual_future_value_rent, results.annual_future_value_buy_recurring
+    future_value_buy_initial, net_proceeds = results.future_value_buy_initial, results.net_proceeds
 
     st.write(f"<p style='color: #646464;'><b>Total Renting Cost: {currency_symbol}{total_renting_cost:,.2f}</b></p>", unsafe_allow_html=True)
     st.write(f"<p style='color: #646464;'><b>Total Buying Cost: {currency_symbol}{total_buying_cost:,.2f}</b></p>", unsafe_allow_html=True)
@@ -243,34 +257,27 @@ if st.button("Calculate Decision"):
 
 # Breakeven
 
-def mortgage_break_even(home_price, monthly_rent, stay_duration, mortgage_rate, down_payment, mortgage_term, investment_return, home_price_growth_rate, rental_growth_rate, cost_of_buying, cost_of_selling, maintenance_cost):
-    low, high = 0, 0.2  # Searching within 0% to 20% mortgage rate
-    while high - low > 0.0001:
-        mid = (high + low) / 2
-        total_renting_cost, total_buying_cost, *_ = calculate_rent_vs_buy(home_price, monthly_rent, stay_duration, mid, down_payment, mortgage_term, investment_return, home_price_growth_rate, rental_growth_rate, cost_of_buying, cost_of_selling, maintenance_cost)  # Pass all arguments here
-        if total_renting_cost > total_buying_cost:
-            low = mid
-        else:
-            high = mid
-    break_even_rate = (high + low) / 2
-    return break_even_rate * 100  # Convert to percentage
-
 def calculate_costs_over_mortgage_rates(home_price, monthly_rent, stay_duration, mortgage_rate, down_payment, mortgage_term, investment_return, home_price_growth_rate, rental_growth_rate, cost_of_buying, cost_of_selling, maintenance_cost):
     rates = np.linspace(0.005, 0.06, 100)  # Mortgage rates from 0.5% to 6%
-    renting_costs = []
-    buying_costs = []
-
-    for rate in rates:
-        total_renting_cost, total_buying_cost, *_ = calculate_rent_vs_buy(home_price, monthly_rent, stay_duration, rate, down_payment, mortgage_term, investment_return, home_price_growth_rate, rental_growth_rate, cost_of_buying, cost_of_selling, maintenance_cost)  # Pass all arguments here
-        renting_costs.append(total_renting_cost)
-        buying_costs.append(total_buying_cost)
-
-    return rates, renting_costs, buying_costs
+    cube = sweep_rent_vs_buy(
+        {"mortgage_rate": rates},
+        home_price=home_price, monthly_rent=monthly_rent, stay_duration=stay_duration, down_payment=down_payment, mortgage_term=mortgage_term,
+        investment_return=investment_return, home_price_growth_rate=home_price_growth_rate, rental_growth_rate=rental_growth_rate,
+        cost_of_buying=cost_of_buying, cost_of_selling=cost_of_selling, maintenance_cost=maintenance_cost,
+    )
+    return rates, cube.total_renting_cost, cube.total_buying_cost
 
 if st.button("Mortgage Rate - Breakeven"):
-    break_even_rate = mortgage_break_even(home_price, monthly_rent, stay_duration, mortgage_rate, down_payment, mortgage_term, investment_return, home_price_growth_rate, rental_growth_rate, cost_of_buying, cost_of_selling, maintenance_cost)  # Pass all arguments here
-    st.write(f"<p style='color: #646464;'><b>Break-even Mortgage Rate: {break_even_rate:.2f}%</b></p>", unsafe_allow_html=True)
-    st.write("That means you break even on your buying and renting cost at this mortgage rate.")
+    break_even_rate = break_even_mortgage_rates(home_price, monthly_rent, stay_duration, down_payment, mortgage_term, investment_return, home_price_growth_rate, rental_growth_rate, cost_of_buying, cost_of_selling, maintenance_cost)
+    if np.isnan(break_even_rate):
+        zero_rate_costs = calculate_rent_vs_buy(home_price, monthly_rent, stay_duration, 0.0, down_payment, mortgage_term, investment_return, home_price_growth_rate, rental_growth_rate, cost_of_buying, cost_of_selling, maintenance_cost)
+        if zero_rate_costs.total_renting_cost < zero_rate_costs.total_buying_cost:
+            st.write("<p style='color: #646464;'><b>No break-even mortgage rate between 0% and 20%: renting costs less even at a 0% mortgage rate.</b></p>", unsafe_allow_html=True)
+        else:
+            st.write("<p style='color: #646464;'><b>No break-even mortgage rate between 0% and 20%: buying costs less even at a 20% mortgage rate.</b></p>", unsafe_allow_html=True)
+    else:
+        st.write(f"<p style='color: #646464;'><b>Break-even Mortgage Rate: {break_even_rate * 100:.2f}%</b></p>", unsafe_allow_html=True)
+        st.write("That means you break even on your buying and renting cost at this mortgage rate.")
     st.write(f"Your current mortgage rate is {mortgage_rate*100:.2f}%")
 
     rates, renting_costs, buying_costs = calculate_costs_over_mortgage_rates(home_price, monthly_rent, stay_duration, mortgage_rate, down_payment, mortgage_term, investment_return, home_price_growth_rate, rental_growth_rate, cost_of_buying, cost_of_selling, maintenance_cost)  # Pass all arguments here
@@ -294,3 +301,63 @@ if st.button("Mortgage Rate - Breakeven"):
     )
     
     st.altair_chart(break_even_chart, use_container_width=True)
+
+
+# Break-even frontier over any two inputs: (label, low, high, shown in %) per input
+FRONTIER_INPUTS = {
+    "home_price": ("Home Price", 0.5 * home_price, 2.0 * home_price, False),
+    "monthly_rent": ("Monthly Rent", 0.5 * monthly_rent, 2.0 * monthly_rent, False),
+    "stay_duration": ("Stay Duration (years)", 1, 40, False),
+    "mortgage_rate": ("Mortgage Rate (%)", 0.0, 0.12, True),
+    "down_payment": ("Down Payment (%)", 0.0, 0.6, True),
+    "mortgage_term": ("Mortgage Term (years)", 5, 40, False),
+    "investment_return": ("Investment Return (%)", 0.0, 0.15, True),
+    "home_price_growth_rate": ("Home Price Growth Rate (%)", 0.0, 0.10, True),
+    "rental_growth_rate": ("Rental Growth Rate (%)", 0.0, 0.10, True),
+    "cost_of_buying": ("Cost of Buying (%)", 0.0, 0.10, True),
+    "cost_of_selling": ("Cost of Selling (%)", 0.0, 0.15, True),
+    "maintenance_cost": ("Maintenance Cost (%)", 0.0, 0.06, True),
+}
+frontier_labels = {name: label for name, (label, _, _, _) in FRONTIER_INPUTS.items()}
+
+st.markdown("<div style='padding-bottom: 30px;'></div>", unsafe_allow_html=True)
+col1, col2 = st.columns(2)
+with col1:
+    frontier_x = st.selectbox("Frontier Horizontal Axis", list(FRONTIER_INPUTS), index=list(FRONTIER_INPUTS).index("home_price_growth_rate"), format_func=frontier_labels.get, key="frontier_x")
+with col2:
+    frontier_y = st.selectbox("Frontier Vertical Axis", [name for name in FRONTIER_INPUTS if name != frontier_x], format_func=frontier_labels.get, key="frontier_y")
+
+if st.button("Break-even Frontier"):
+    current_inputs = dict(
+        home_price=home_price, monthly_rent=monthly_rent, stay_duration=stay_duration, mortgage_rate=mortgage_rate, down_payment=down_payment, mortgage_term=mortgage_term,
+        investment_return=investment_return, home_price_growth_rate=home_price_growth_rate, rental_growth_rate=rental_growth_rate,
+        cost_of_buying=cost_of_buying, cost_of_selling=cost_of_selling, maintenance_cost=maintenance_cost,
+    )
+    # One 150 x 150 grid of costs, contoured where the cheaper option changes
+    frontier_axes = {name: np.linspace(FRONTIER_INPUTS[name][1], FRONTIER_INPUTS[name][2], 150) for name in (frontier_x, frontier_y)}
+    fixed_inputs = {name: value for name, value in current_inputs.items() if name not in frontier_axes}
+    frontier_points = sweep_rent_vs_buy(frontier_axes, **fixed_inputs).indifference_points()
+
+    def display_values(name, values):
+        return values * 100 if FRONTIER_INPUTS[name][3] else values
+
+    x_label, y_label = frontier_labels[frontier_x], frontier_labels[frontier_y]
+    # Shade the cheaper option on every third grid point
+    grid = sweep_rent_vs_buy({name: values[::3] for name, values in frontier_axes.items()}, **fixed_inputs).to_frame()
+    grid['Cheaper Option'] = np.where(grid['total_renting_cost'] < grid['total_buying_cost'], 'Renting', 'Buying')
+    grid[x_label], grid[y_label] = display_values(frontier_x, grid[frontier_x]), display_values(frontier_y, grid[frontier_y])
+    frontier_points[x_label], frontier_points[y_label] = display_values(frontier_x, frontier_points[frontier_x]), display_values(frontier_y, frontier_points[frontier_y])
+    current_point = pd.DataFrame({x_label: [display_values(frontier_x, current_inputs[frontier_x])], y_label: [display_values(frontier_y, current_inputs[frontier_y])]})
+
+    regions = alt.Chart(grid).mark_square(size=100, opacity=0.25).encode(
+        x=alt.X(f'{x_label}:Q', title=x_label),
+        y=alt.Y(f'{y_label}:Q', title=y_label),
+        color=alt.Color('Cheaper Option:N', scale=alt.Scale(domain=['Renting', 'Buying'], range=['#7EB6D9', '#F39373'])),
+    )
+    frontier_line = alt.Chart(frontier_points).mark_circle(size=12, color='black').encode(x=f'{x_label}:Q', y=f'{y_label}:Q', tooltip=[f'{x_label}:Q', f'{y_label}:Q'])
+    you_are_here = alt.Chart(current_point).mark_point(size=120, shape='diamond', filled=True, color='black').encode(x=f'{x_label}:Q', y=f'{y_label}:Q')
+    st.altair_chart(alt.layer(regions, frontier_line, you_are_here).properties(title='Where Renting and Buying Cost the Same', width=600, height=400), use_container_width=True)
+    if frontier_points.empty:
+        st.write(f"{grid['Cheaper Option'].iloc[0]} is cheaper across this whole range, so there is no break-even frontier.")
+    else:
+        st.write("The black curve is the break-even frontier: on one side renting costs less, on the other buying does. The diamond marks your current inputs.")
@@ -0,0 +1,136 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+# Built-in asset classes in sidebar order: (key, label, default growth rate %, default volatility %)
+ASSET_CLASSES = [
+    ("equities", "Equities", 10.0, 16.0),
+    ("fixed_income", "Fixed Income", 4.0, 6.0),
+    ("cash", "Cash", 0.0, 0.5),
+    ("cash_equivalents", "Cash Equivalents", 2.0, 1.0),
+    ("commodities", "Commodities", 3.0, 18.0),
+    ("real_estate", "Real Estate", 4.0, 12.0),
+    ("cryptocurrency", "Cryptocurrency", 15.0, 70.0),
+    ("reits", "REITs", 6.0, 20.0),
+    ("alternatives", "Alternatives", 8.0, 12.0),
+    ("cpf", "CPF or Retirement", 4.0, 0.5),
+]
+
+ASSET_KEYS = [key for key, _, _, _ in ASSET_CLASSES]
+ASSET_LABELS = [label for _, label, _, _ in ASSET_CLASSES]
+DEFAULT_GROWTH_RATES = {key: growth_rate for key, _, growth_rate, _ in ASSET_CLASSES}
+DEFAULT_VOLATILITIES = {key: volatility for key, _, _, volatility in ASSET_CLASSES}
+
+# Sidebar starting allocation (%); other asset classes start at 0
+DEFAULT_ALLOCATIONS = {"equities": 70.0, "fixed_income": 20.0, "cash": 10.0}
+
+# Pairwise correlations between built-in asset classes; pairs not listed are uncorrelated
+DEFAULT_CORRELATIONS = {
+    ("equities", "fixed_income"): 0.1,
+    ("equities", "commodities"): 0.3,
+    ("equities", "real_estate"): 0.5,
+    ("equities", "cryptocurrency"): 0.4,
+    ("equities", "reits"): 0.7,
+    ("equities", "alternatives"): 0.6,
+    ("fixed_income", "cash_equivalents"): 0.3,
+    ("fixed_income", "real_estate"): 0.2,
+    ("fixed_income", "reits"): 0.2,
+    ("cash", "cash_equivalents"): 0.8,
+    ("commodities", "real_estate"): 0.2,
+    ("commodities", "cryptocurrency"): 0.2,
+    ("commodities", "reits"): 0.2,
+    ("real_estate", "reits"): 0.8,
+    ("real_estate", "alternatives"): 0.3,
+    ("cryptocurrency", "alternatives"): 0.3,
+    ("reits", "alternatives"): 0.4,
+}
+
+# Custom assets (e.g. a single stock) are modelled as equity-like: volatility and
+# correlation to equities, with correlation to everything else following from that
+DEFAULT_CUSTOM_VOLATILITY = 30.0
+DEFAULT_CUSTOM_EQUITY_CORRELATION = 0.6
+
+
+def default_correlation_matrix():
+    # (built-in x built-in) correlation matrix in ASSET_KEYS order
+    index = {key: i for i, key in enumerate(ASSET_KEYS)}
+    correlation = np.eye(len(ASSET_KEYS))
+    for (first, second), value in DEFAULT_CORRELATIONS.items():
+        correlation[index[first], index[second]] = value
+        correlation[index[second], index[first]] = value
+    return correlation
+
+
+def add_custom_assets(correlation, num_custom, equity_correlation=DEFAULT_CUSTOM_EQUITY_CORRELATION):
+    # Extend a built-in correlation matrix with custom assets that load on equities:
+    # corr(custom, x) = beta * corr(equities, x) and corr(custom, custom) = beta ** 2,
+    # which keeps the matrix positive semi-definite
+    equities = ASSET_KEYS.index("equities")
+    size = len(correlation)
+    extended = np.eye(size + num_custom)
+    extended[:size, :size] = correlation
+    loadings = equity_correlation * correlation[equities]
+    for i in range(num_custom):
+        extended[size + i, :size] = loadings
+        extended[:size, size + i] = loadings
+        for j in range(num_custom):
+            if i != j:
+                extended[size + i, size + j] = equity_correlation ** 2
+    return extended
+
+
+def covariance_matrix(volatilities, correlation):
+    # volatilities are fractions (0.16 for 16%)
+    volatilities = np.asarray(volatilities, dtype=float)
+    return correlation * np.outer(volatilities, volatilities)
+
+
+@dataclass
+class AssetRegistry:
+    # Built-in asset classes in ASSET_CLASSES order followed by custom assets, as aligned
+    # arrays in % so portfolio figures are single dot products however many assets there are.
+    # Arrays are (assets,) for one portfolio or (portfolios x assets) for many, e.g. one per
+    # row of a batch file; portfolio figures are then (portfolios,).
+    labels: list
+    allocations: np.ndarray
+    growth_rates: np.ndarray
+    volatilities: np.ndarray
+    num_custom: int = 0
+
+    @property
+    def total_allocation(self):
+        return self.allocations.sum(axis=-1)[()]
+
+    @property
+    def weights(self):
+        # Allocations as fractions of the total
+        return self.allocations / np.maximum(self.total_allocation, 1e-9)[..., None]
+
+    @property
+    def blended_return(self):
+        # Allocation-weighted growth rate (%), 0 with nothing allocated
+        total = self.total_allocation
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(total > 0, (self.allocations * self.growth_rates).sum(axis=-1) / total, 0.0)[()]
+
+    @property
+    def history_keys(self):
+        # Column of the historical returns file for each asset; custom assets follow equities
+        return ASSET_KEYS + ["equities"] * self.num_custom
+
+
+def asset_registry(allocations, growth_rates, volatilities, custom_assets=()):
+    # allocations, growth_rates and volatilities map built-in keys to %; custom_assets are
+    # (name, allocation %, growth rate %, volatility %) tuples. Any value may be a
+    # (portfolios,) array instead of a number to describe many portfolios at once.
+    def stack(built_in, position):
+        values = [built_in[key] for key in ASSET_KEYS] + [asset[position] for asset in custom_assets]
+        return np.stack(np.broadcast_arrays(*[np.asarray(value, dtype=float) for value in values]), axis=-1)
+
+    return AssetRegistry(
+        labels=ASSET_LABELS + [name for name, *_ in custom_assets],
+        allocations=stack(allocations, 1),
+        growth_rates=stack(growth_rates, 2),
+        volatilities=stack(volatilities, 3),
+        num_custom=len(custom_assets),
+    )
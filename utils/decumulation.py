@@ -0,0 +1,115 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from utils.quantiles import QuantileSketch
+from utils.simulation import DEFAULT_CHUNK_SIZE, PERCENTILES, iter_chunks, new_seed, sample_portfolio_returns
+
+# Percentiles reported for wealth at the end of the horizon
+TERMINAL_PERCENTILES = [5, 10, 25, 50, 75, 90, 95]
+
+
+@dataclass
+class WithdrawalRule:
+    # How retirement spending is set each year. Amounts are in today's money, since the
+    # simulation runs on real (inflation-adjusted) returns.
+    #   "constant":   spend annual_spending every year
+    #   "guardrails": Guyton-Klinger style; cut spending by `adjustment` when the current
+    #                 withdrawal rate rises `band` above the initial rate, raise it by
+    #                 `adjustment` when it falls `band` below
+    #   "variable":   spend variable_rate of the portfolio, kept between floor and ceiling
+    #                 times annual_spending
+    kind: str = "constant"
+    band: float = 0.2
+    adjustment: float = 0.1
+    variable_rate: float = 0.04
+    floor: float = 0.8
+    ceiling: float = 1.5
+
+
+def evolve_lifecycle(current_savings, annual_savings, accumulation_years, annual_spending, withdrawal_rule, portfolio_returns):
+    # Accumulation (contributions at the end of each year) followed by decumulation
+    # (withdrawals at the start of each year) for every trial at once. Wealth that runs
+    # out stays at zero. Takes (trials x years) real returns, gives (years x trials) wealth.
+    num_trials, years = portfolio_returns.shape
+    growth = np.ascontiguousarray(portfolio_returns.T)
+    growth += 1
+    wealth_by_year = np.empty((years, num_trials))
+    wealth = np.full(num_trials, float(current_savings))
+
+    for year in range(min(accumulation_years, years)):
+        wealth *= growth[year]
+        wealth += annual_savings
+        wealth_by_year[year] = wealth
+
+    spending = np.full(num_trials, float(annual_spending))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        initial_rate = spending / wealth
+    for year in range(accumulation_years, years):
+        if withdrawal_rule.kind == "guardrails":
+            with np.errstate(divide="ignore", invalid="ignore"):
+                current_rate = spending / wealth
+            spending[current_rate > initial_rate * (1 + withdrawal_rule.band)] *= 1 - withdrawal_rule.adjustment
+            spending[current_rate < initial_rate * (1 - withdrawal_rule.band)] *= 1 + withdrawal_rule.adjustment
+        elif withdrawal_rule.kind == "variable":
+            np.clip(withdrawal_rule.variable_rate * wealth, withdrawal_rule.floor * annual_spending, withdrawal_rule.ceiling * annual_spending, out=spending)
+        elif withdrawal_rule.kind != "constant":
+            raise ValueError(f"Unknown withdrawal rule: {withdrawal_rule.kind}")
+        wealth -= spending
+        np.maximum(wealth, 0, out=wealth)
+        wealth *= growth[year]
+        wealth_by_year[year] = wealth
+    return wealth_by_year
+
+
+@dataclass
+class LifecycleResult:
+    percentiles: np.ndarray  # (len(PERCENTILES) x years) wealth over accumulation and retirement
+    depletion_probability: np.ndarray  # (retirement years,) share of trials depleted by the end of each retirement year
+    terminal_wealth: np.ndarray  # (num_trials,) wealth at the end of the horizon
+    num_trials: int
+    seed: int
+
+    @property
+    def terminal_percentiles(self):
+        return np.percentile(self.terminal_wealth, TERMINAL_PERCENTILES)
+
+    @property
+    def success_rate(self):
+        # Share of trials whose money lasts the whole horizon
+        return float(1 - self.depletion_probability[-1]) if len(self.depletion_probability) else 1.0
+
+
+def _lifecycle_chunk(chunk_index, rng, num_trials, current_savings, annual_savings, accumulation_years, retirement_years, annual_spending, withdrawal_rule, weights, return_model, inflation_rate, relative_accuracy):
+    years = accumulation_years + retirement_years
+    portfolio_returns = sample_portfolio_returns(return_model, rng, num_trials, years, weights)
+    portfolio_returns -= inflation_rate
+    wealth_by_year = evolve_lifecycle(current_savings, annual_savings, accumulation_years, annual_spending, withdrawal_rule, portfolio_returns)
+    sketch = QuantileSketch(years, relative_accuracy)
+    sketch.add(wealth_by_year)
+    depleted = (wealth_by_year[accumulation_years:] <= 0).sum(axis=1)
+    return sketch, depleted, wealth_by_year[-1].copy()
+
+
+def run_lifecycle(current_savings, annual_savings, accumulation_years, retirement_years, annual_spending, withdrawal_rule, weights, return_model, inflation_rate, num_trials, seed=None, workers=1, chunk_size=DEFAULT_CHUNK_SIZE, relative_accuracy=0.005):
+    # One simulation covering accumulation and decumulation, chunked and seeded like
+    # run_monte_carlo. Per-year wealth percentiles come from quantile sketches and depletion
+    # from per-year counts, so only terminal wealth is kept per trial.
+    inputs = dict(
+        current_savings=current_savings, annual_savings=annual_savings, accumulation_years=accumulation_years,
+        retirement_years=retirement_years, annual_spending=annual_spending, withdrawal_rule=withdrawal_rule,
+        weights=weights, return_model=return_model, inflation_rate=inflation_rate, relative_accuracy=relative_accuracy,
+    )
+    if seed is None:
+        seed = new_seed()
+
+    # Fold each chunk in as it arrives so only one chunk's sketch is alive at a time
+    sketch, depleted, terminal_wealth = None, 0, []
+    for chunk_sketch, chunk_depleted, chunk_terminal in iter_chunks(_lifecycle_chunk, inputs, num_trials, seed, workers, chunk_size):
+        if sketch is None:
+            sketch = chunk_sketch
+        else:
+            sketch.merge(chunk_sketch)
+        depleted = depleted + chunk_depleted
+        terminal_wealth.append(chunk_terminal)
+    return LifecycleResult(sketch.quantile(PERCENTILES), depleted / num_trials, np.concatenate(terminal_wealth), num_trials, seed)
@@ -0,0 +1,127 @@
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utils.assets import ASSET_KEYS, DEFAULT_CUSTOM_VOLATILITY, DEFAULT_GROWTH_RATES, DEFAULT_VOLATILITIES, asset_registry
+from utils.fire_plan import FIRE_MULTIPLE, future_savings, years_to_target
+
+# Evaluate the FIRE plan for every row of a CSV or Parquet file of client profiles. Rows
+# are read and written in chunks, and each chunk is one vectorized pass over its columns,
+# so memory stays bounded however large the file is. Parquet needs pyarrow.
+#
+#     python -m utils.fire_batch profiles.parquet results.parquet
+#
+# Each row needs age, desired_fire_age, annual_expenses, current_savings, annual_income,
+# savings_rate (%) and inflation_rate (%), plus the allocation: either annual_return (%)
+# or allocation % columns named by asset key (equities, fixed_income, ...), blended
+# through utils.assets.asset_registry like the page's sidebar. A <key>_growth_rate column
+# (%) overrides an asset's default growth rate, and a custom asset is a pair of
+# <name>_allocation and <name>_growth_rate columns.
+PROFILE_COLUMNS = ["age", "desired_fire_age", "annual_expenses", "current_savings", "annual_income", "savings_rate", "inflation_rate"]
+DEFAULT_CHUNK_ROWS = 250_000
+
+
+def profile_assets(profiles):
+    # AssetRegistry with one portfolio per row, built from the allocation columns
+    rows = len(profiles)
+
+    def column(name, default):
+        return profiles[name].to_numpy(dtype=float) if name in profiles.columns else np.full(rows, default)
+
+    custom_names = [name[:-len("_allocation")] for name in profiles.columns if name.endswith("_allocation")]
+    missing = [f"{name}_growth_rate" for name in custom_names if f"{name}_growth_rate" not in profiles.columns]
+    if missing:
+        raise ValueError(f"Custom assets need growth rate columns: {', '.join(missing)}")
+    if not custom_names and not any(key in profiles.columns for key in ASSET_KEYS):
+        raise ValueError(f"Profiles need an annual_return column, allocation columns from {ASSET_KEYS} or custom <name>_allocation columns")
+    return asset_registry(
+        {key: column(key, 0.0) for key in ASSET_KEYS},
+        {key: column(f"{key}_growth_rate", DEFAULT_GROWTH_RATES[key]) for key in ASSET_KEYS},
+        DEFAULT_VOLATILITIES,
+        [(name, column(f"{name}_allocation", 0.0), column(f"{name}_growth_rate", 0.0), DEFAULT_CUSTOM_VOLATILITY) for name in custom_names],
+    )
+
+
+def evaluate_fire_plans(profiles):
+    # calculate_fire_plan over every row at once. Returns a frame with one result row per
+    # profile; years are inf where the FIRE number is never reached.
+    missing = [column for column in PROFILE_COLUMNS if column not in profiles.columns]
+    if missing:
+        raise ValueError(f"Profiles are missing columns: {', '.join(missing)}")
+    column = {name: profiles[name].to_numpy(dtype=float) for name in PROFILE_COLUMNS}
+    annual_return = profiles["annual_return"].to_numpy(dtype=float) if "annual_return" in profiles.columns else profile_assets(profiles).blended_return
+
+    fire_number = FIRE_MULTIPLE * column["annual_expenses"]
+    real_rate_of_return = (annual_return - column["inflation_rate"]) / 100
+    annual_savings = column["annual_income"] * column["savings_rate"] / 100
+    with np.errstate(over="ignore", invalid="ignore"):
+        projected_savings = future_savings(column["current_savings"], annual_savings, real_rate_of_return, column["desired_fire_age"] - column["age"])
+    gap = np.maximum(fire_number - projected_savings, 0.0)
+    years_to_fire = years_to_target(column["current_savings"], annual_savings, real_rate_of_return, fire_number)
+
+    return pd.DataFrame({
+        "annual_return": annual_return,
+        "fire_number": fire_number,
+        "projected_savings": projected_savings,
+        "can_retire": projected_savings >= fire_number,
+        "gap": gap,
+        "additional_years_needed": years_to_target(projected_savings, annual_savings, real_rate_of_return, fire_number),
+        "years_to_fire": years_to_fire,
+        "fire_age": column["age"] + years_to_fire,
+    }, index=profiles.index)
+
+
+def read_profiles(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    # Yields DataFrame chunks of at most chunk_rows rows
+    path = Path(path)
+    if path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+
+
+def run_batch(in_path, out_path, chunk_rows=DEFAULT_CHUNK_ROWS, keep_columns=()):
+    # Stream in_path through evaluate_fire_plans into out_path (.csv or .parquet), keeping
+    # any keep_columns (e.g. a client id) from the input. Returns the number of rows.
+    out_path = Path(out_path)
+    writer = None
+    num_rows = 0
+    try:
+        for profiles in read_profiles(in_path, chunk_rows):
+            results = evaluate_fire_plans(profiles)
+            results = pd.concat([profiles[list(keep_columns)], results], axis=1)
+            if out_path.suffix == ".parquet":
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+
+                table = pa.Table.from_pandas(results, preserve_index=False)
+                writer = writer or pq.ParquetWriter(out_path, table.schema)
+                writer.write_table(table)
+            else:
+                results.to_csv(out_path, mode="a" if num_rows else "w", header=not num_rows, index=False)
+            num_rows += len(results)
+    finally:
+        if writer is not None:
+            writer.close()
+    return num_rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate the FIRE plan for every profile in a CSV or Parquet file")
+    parser.add_argument("in_path")
+    parser.add_argument("out_path", help="Results file (.csv or .parquet)")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--keep", nargs="*", default=[], help="Input columns to copy into the results, e.g. a client id")
+    args = parser.parse_args(argv)
+
+    num_rows = run_batch(args.in_path, args.out_path, args.chunk_rows, args.keep)
+    print(f"Wrote {num_rows:,} results to {args.out_path}")
+
+
+if __name__ == "__main__":
+    main()
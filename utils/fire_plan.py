@@ -0,0 +1,154 @@
+import logging
+from dataclasses import dataclass, field
+
+import numpy as np
+
+# FIRE math without any Streamlit calls, so it can run in workers, benchmarks and batch
+# jobs. The array functions broadcast over NumPy arrays, so one call evaluates a whole grid
+# of scenarios.
+
+logger = logging.getLogger(__name__)
+
+# FIRE number as a multiple of annual expenses (the 4% rule)
+FIRE_MULTIPLE = 25
+
+
+def period_rate(real_rate_of_return, periods_per_year):
+    # Per-period rate that compounds to real_rate_of_return over a year
+    if periods_per_year == 1:
+        return real_rate_of_return
+    with np.errstate(invalid="ignore"):
+        return (1 + real_rate_of_return) ** (1 / periods_per_year) - 1
+
+
+def future_savings(current_savings, annual_savings, real_rate_of_return, years, periods_per_year=1):
+    # Savings after `years` of growth at real_rate_of_return (a fraction) plus annual_savings
+    # at the end of each year, the same closed form calculate_fire_plan uses. With
+    # periods_per_year (12 for monthly), annual_savings is paid in equal instalments at the
+    # end of each period and growth compounds every period.
+    rate = period_rate(np.asarray(real_rate_of_return, dtype=float), periods_per_year)
+    periods = np.asarray(years, dtype=float) * periods_per_year
+    growth = (1 + rate) ** periods
+    annuity_factor = np.divide(growth - 1, rate, out=np.broadcast_to(periods, growth.shape).copy(), where=rate != 0)
+    return current_savings * growth + annual_savings / periods_per_year * annuity_factor
+
+
+def what_if_surface(current_savings, annual_income, savings_rates, annual_returns, horizons, inflation_rate, periods_per_year=1):
+    # (savings rate x annual return x horizon) cube of savings, from one broadcast.
+    # savings_rates, annual_returns and inflation_rate are in %, horizons in years.
+    savings_rates = np.asarray(savings_rates, dtype=float)[:, None, None]
+    annual_returns = np.asarray(annual_returns, dtype=float)[None, :, None]
+    horizons = np.asarray(horizons, dtype=float)[None, None, :]
+    annual_savings = annual_income * savings_rates / 100
+    real_rate_of_return = (annual_returns - inflation_rate) / 100
+    return future_savings(current_savings, annual_savings, real_rate_of_return, horizons, periods_per_year)
+
+
+def years_to_target(current_savings, annual_savings, real_rate_of_return, target, periods_per_year=1):
+    # Fractional years until savings = savings * (1 + r) + annual_savings first reaches
+    # target, solved in closed form: (S + a/r) * (1 + r) ** n - a/r = target.
+    # Returns np.inf where the target is never reached (e.g. savings shrink, or a negative
+    # real return caps savings at a/|r| below the target). Broadcasts over all inputs.
+    # With periods_per_year, n counts periods (see future_savings) and is returned in years.
+    current_savings, annual_savings, real_rate_of_return, target = np.broadcast_arrays(
+        *(np.asarray(value, dtype=float) for value in (current_savings, annual_savings, real_rate_of_return, target))
+    )
+    real_rate_of_return = period_rate(real_rate_of_return, periods_per_year)
+    annual_savings = annual_savings / periods_per_year
+    growth = 1 + real_rate_of_return
+    with np.errstate(divide="ignore", invalid="ignore"):
+        offset = annual_savings / real_rate_of_return  # a/r
+        compounding_years = np.log((target + offset) / (current_savings + offset)) / np.log(growth)
+        linear_years = (target - current_savings) / annual_savings
+    years = np.where(real_rate_of_return == 0, linear_years, compounding_years)
+    years = np.where(np.isfinite(years) & (years >= 0) & (growth > 0), years, np.inf)
+    years = np.where(current_savings >= target, 0.0, years / periods_per_year)
+    return years if years.ndim else float(years)
+
+
+@dataclass
+class FireInputs:
+    age: float
+    desired_fire_age: float
+    annual_expenses: float
+    current_savings: float
+    annual_return: float  # expected nominal return, %
+    annual_income: float
+    savings_rate: float  # % of annual income
+    inflation_rate: float  # %
+    periods_per_year: int = 1  # 12 to save and compound monthly
+
+    @property
+    def years_until_fire(self) -> float:
+        return self.desired_fire_age - self.age
+
+
+@dataclass
+class FirePlan:
+    fire_number: float
+    real_rate_of_return: float  # fraction
+    annual_savings: float
+    current_savings_growth: float  # current savings grown to the desired FIRE age
+    annual_savings_growth: float  # future value of the annual savings at the desired FIRE age
+    actual_savings_at_desired_fire_age: float
+    can_retire: bool
+    gap: float
+    additional_years_needed: float  # saving past the desired FIRE age; inf if never reached
+    years_to_fire: float  # from today; inf if never reached
+    warnings: list = field(default_factory=list)  # messages for the caller to show
+
+
+def calculate_fire_plan(inputs: FireInputs) -> FirePlan:
+    warnings = []
+    fire_number = FIRE_MULTIPLE * inputs.annual_expenses
+    real_rate_of_return = (inputs.annual_return - inputs.inflation_rate) / 100
+    annual_savings = inputs.annual_income * (inputs.savings_rate / 100)
+    n = inputs.years_until_fire
+
+    with np.errstate(over="ignore"):
+        current_savings_growth = float(future_savings(inputs.current_savings, 0, real_rate_of_return, n, inputs.periods_per_year))
+        annual_savings_growth = float(future_savings(0, annual_savings, real_rate_of_return, n, inputs.periods_per_year))
+    if not np.isfinite(current_savings_growth + annual_savings_growth):
+        warnings.append("The savings growth calculation overflowed. Please check the input values.")
+        logger.error("Savings growth calculation overflowed.")
+    actual_savings_at_desired_fire_age = current_savings_growth + annual_savings_growth
+    logger.info(f"Current Savings Growth: {current_savings_growth}, Annual Savings Growth: {annual_savings_growth}")
+
+    can_retire = actual_savings_at_desired_fire_age >= fire_number
+    if can_retire:
+        gap = 0.0
+        additional_years_needed = 0.0
+    else:
+        gap = fire_number - actual_savings_at_desired_fire_age
+        additional_years_needed = years_to_target(actual_savings_at_desired_fire_age, annual_savings, real_rate_of_return, fire_number, inputs.periods_per_year)
+        if additional_years_needed == np.inf:
+            warnings.append("With these savings and returns you would not reach your FIRE number by continuing to save.")
+    logger.info(f"Actual Savings at Desired FIRE Age: {actual_savings_at_desired_fire_age}, Additional Years Needed: {additional_years_needed}")
+
+    return FirePlan(
+        fire_number=fire_number,
+        real_rate_of_return=real_rate_of_return,
+        annual_savings=annual_savings,
+        current_savings_growth=current_savings_growth,
+        annual_savings_growth=annual_savings_growth,
+        actual_savings_at_desired_fire_age=actual_savings_at_desired_fire_age,
+        can_retire=can_retire,
+        gap=gap,
+        additional_years_needed=additional_years_needed,
+        years_to_fire=years_to_target(inputs.current_savings, annual_savings, real_rate_of_return, fire_number, inputs.periods_per_year),
+        warnings=warnings,
+    )
+
+
+def savings_trajectories(inputs: FireInputs, plan: FirePlan):
+    # Yearly savings from today to the desired FIRE age: the projected path, and the path
+    # that compounds current savings at the single growth rate needed to hit the FIRE
+    # number. Returns (ages, projected, required).
+    years = np.arange(int(inputs.years_until_fire) + 1)
+    projected = future_savings(inputs.current_savings, plan.annual_savings, plan.real_rate_of_return, years, inputs.periods_per_year)
+    # NumPy scalars, so no savings or no years left give inf/nan instead of raising
+    current_savings = np.float64(inputs.current_savings)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        required_growth_rate = (plan.fire_number / current_savings) ** (1 / np.float64(inputs.years_until_fire)) - 1
+        required = current_savings * (1 + required_growth_rate) ** years
+    return int(inputs.age) + years, projected, required
@@ -0,0 +1,67 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from utils.simulation import DEFAULT_CHUNK_SIZE, evolve_savings, per_period_inputs, period_weights, run_chunks, sample_portfolio_returns
+
+# Glide paths: allocations that change with age, given to the engine as (years x assets)
+# weight matrices with one row per simulated year. A stack of candidate glide paths
+# (candidates x years x assets) broadcasts against a single draw of asset returns, so
+# every candidate is simulated on the same markets (common random numbers) and the
+# differences between them are not sampling noise.
+
+
+def linear_glide_path(start_weights, end_weights, years):
+    # (years x assets) weights moving in equal steps from start_weights in the first year
+    # to end_weights in the last; stacks of start or end weights give a stack of paths
+    start = np.asarray(start_weights, dtype=float)[..., None, :]
+    end = np.asarray(end_weights, dtype=float)[..., None, :]
+    return start + (end - start) * np.linspace(0, 1, years)[:, None]
+
+
+def hold_final_allocation(weights, years):
+    # A glide path cut or extended to years rows, keeping its last allocation; fixed
+    # weights are returned as they are
+    weights = np.asarray(weights, dtype=float)
+    if weights.ndim == 1:
+        return weights
+    return weights[..., np.minimum(np.arange(years), weights.shape[-2] - 1), :]
+
+
+@dataclass
+class GlidePathRanking:
+    success_probability: np.ndarray  # (candidates,) share of trials at or above target at the end
+    median_final_savings: np.ndarray  # (candidates,)
+    num_trials: int
+    seed: int
+
+    @property
+    def order(self):
+        # Candidate indices, highest success probability first
+        return np.argsort(-self.success_probability, kind="stable")
+
+
+def _glide_path_chunk(chunk_index, rng, num_trials, current_savings, annual_savings, glide_paths, return_model, inflation_rate, periods_per_year):
+    # (candidates x trials) final savings. The candidates' returns are one batch, so they
+    # evolve together as candidates * trials paths.
+    num_candidates, num_periods, _ = glide_paths.shape
+    real_returns = sample_portfolio_returns(return_model, rng, num_trials, num_periods, glide_paths)
+    real_returns -= inflation_rate
+    savings_by_year = evolve_savings(current_savings, annual_savings, real_returns.reshape(-1, num_periods), periods_per_year)
+    return savings_by_year[-1].reshape(num_candidates, num_trials)
+
+
+def rank_glide_paths(current_savings, annual_savings, glide_paths, return_model, inflation_rate, num_trials, target, seed=None, workers=1, periods_per_year=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Simulate every (years x assets) glide path in glide_paths on the same returns and
+    # score each by its chance of ending at or above target. inflation_rate is a fraction.
+    # Chunks shrink with the number of candidates so their memory matches run_monte_carlo's.
+    glide_paths = np.asarray(glide_paths, dtype=float)
+    return_model, inflation_rate = per_period_inputs(return_model, glide_paths, inflation_rate, periods_per_year)
+    inputs = dict(
+        current_savings=current_savings, annual_savings=annual_savings, glide_paths=period_weights(glide_paths, periods_per_year),
+        return_model=return_model, inflation_rate=inflation_rate, periods_per_year=periods_per_year,
+    )
+    chunk_size = max(1, chunk_size // (periods_per_year * len(glide_paths)))
+    chunk_results, seed = run_chunks(_glide_path_chunk, inputs, num_trials, seed, workers, chunk_size)
+    final_savings = np.concatenate(chunk_results, axis=1)
+    return GlidePathRanking((final_savings >= target).mean(axis=1), np.median(final_savings, axis=1), num_trials, seed)
@@ -0,0 +1,142 @@
+import argparse
+import json
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils.simulation import PERCENTILES
+
+# Historical returns live in a .npy file of float32 returns (periods x assets, fractions)
+# with a .json sidecar describing the columns. The .npy file is memory-mapped, so the
+# page never parses it on a rerun.
+#
+# Build it from a CSV whose first column is the period (year, or year-month for monthly
+# data) and whose other columns are asset keys from utils.assets with nominal returns in %:
+#
+#     python -m utils.historical build returns.csv --periods-per-year 1
+HISTORY_PATH = Path(__file__).resolve().parent.parent / "data" / "historical_returns.npy"
+
+
+@dataclass
+class ReturnHistory:
+    returns: np.ndarray  # (periods x assets) memory-mapped returns
+    assets: list
+    start_period: str
+    periods_per_year: int
+
+    @property
+    def num_years(self):
+        return len(self.returns) // self.periods_per_year
+
+
+def build_history_file(csv_path, out_path=HISTORY_PATH, periods_per_year=1):
+    data = pd.read_csv(csv_path, index_col=0)
+    if data.isna().any().any():
+        raise ValueError("Historical returns must not have missing values; trim the CSV to periods where every asset has data")
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    returns = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.float32, shape=data.shape)
+    returns[:] = data.to_numpy(dtype=np.float32) / 100
+    returns.flush()
+    metadata = {"assets": list(data.columns), "start_period": str(data.index[0]), "periods_per_year": periods_per_year}
+    out_path.with_suffix(".json").write_text(json.dumps(metadata, indent=2))
+    return out_path
+
+
+def load_history(path=HISTORY_PATH):
+    # Raises FileNotFoundError if the returns file has not been built yet
+    path = Path(path)
+    return _load_history(str(path), path.stat().st_mtime)
+
+
+@lru_cache(maxsize=4)
+def _load_history(path, mtime):
+    metadata = json.loads(Path(path).with_suffix(".json").read_text())
+    returns = np.load(path, mmap_mode="r")
+    return ReturnHistory(returns, metadata["assets"], metadata["start_period"], metadata["periods_per_year"])
+
+
+def allocation_weights(history, asset_keys, percentages):
+    # Map an allocation onto the history's columns. Returns normalized weights and the
+    # allocated asset keys that have no history.
+    weights = np.zeros(len(history.assets))
+    missing_assets = []
+    for key, percentage in zip(asset_keys, percentages):
+        if key in history.assets:
+            weights[history.assets.index(key)] += percentage
+        elif percentage > 0:
+            missing_assets.append(key)
+    return weights / max(weights.sum(), 1e-9), missing_assets
+
+
+def annual_portfolio_returns(history, weights):
+    # (years,) portfolio returns; monthly histories are compounded within each year
+    returns = np.asarray(history.returns, dtype=float) @ np.asarray(weights, dtype=float)
+    if history.periods_per_year == 1:
+        return returns
+    returns = returns[:history.num_years * history.periods_per_year].reshape(history.num_years, history.periods_per_year)
+    return np.prod(1 + returns, axis=1) - 1
+
+
+@dataclass
+class CohortReplay:
+    start_years: np.ndarray  # first calendar year of each cohort
+    savings_by_year: np.ndarray  # (years x cohorts)
+    success: np.ndarray  # (cohorts,) final savings reached the target
+    percentiles: np.ndarray  # (len(PERCENTILES) x years), same layout as the Monte Carlo result
+
+    @property
+    def success_rate(self):
+        return float(self.success.mean())
+
+    @property
+    def worst_cohort(self):
+        # (start year, final savings) of the cohort that ended with the least
+        worst = int(np.argmin(self.savings_by_year[-1]))
+        return int(self.start_years[worst]), float(self.savings_by_year[-1, worst])
+
+
+def replay_cohorts(history, weights, current_savings, annual_savings, years, inflation_rate, target):
+    # Run the plan once for every historical start year (cFIREsim style). Cohort c's year t
+    # uses the return of calendar year c + t, so the growth of every cohort in year t is
+    # the slice growth[t:t + cohorts]. The (years x cohorts) sliding window view over the
+    # growth series is stepped through row by row, so no window is ever copied.
+    real_returns = annual_portfolio_returns(history, weights) - inflation_rate
+    if not 0 < years <= len(real_returns):
+        raise ValueError(f"Cannot replay {years} years against a returns history of {len(real_returns)} years")
+    num_cohorts = len(real_returns) - years + 1
+    growth_by_year = sliding_window_view(real_returns + 1, num_cohorts)
+    savings_by_year = np.empty((years, num_cohorts))
+    savings = np.full(num_cohorts, float(current_savings))
+    for year, growth in enumerate(growth_by_year):
+        savings *= growth
+        savings += annual_savings
+        savings_by_year[year] = savings
+    start_years = int(str(history.start_period)[:4]) + np.arange(num_cohorts)
+    return CohortReplay(
+        start_years,
+        savings_by_year,
+        savings_by_year[-1] >= target,
+        np.percentile(savings_by_year, PERCENTILES, axis=1),
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the memory-mapped historical returns file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Convert a CSV of returns (%) into the binary returns file")
+    build.add_argument("csv_path")
+    build.add_argument("--out", default=str(HISTORY_PATH))
+    build.add_argument("--periods-per-year", type=int, choices=[1, 12], default=1)
+    args = parser.parse_args(argv)
+
+    out_path = build_history_file(args.csv_path, args.out, args.periods_per_year)
+    print(f"Wrote {out_path}")
+
+
+if __name__ == "__main__":
+    main()
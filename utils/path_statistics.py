@@ -0,0 +1,55 @@
+import numpy as np
+
+# Per-trial path statistics reduced to fixed-size histograms, one year at a time, so they
+# can be merged across chunks by adding counts and never need the paths kept around.
+
+# Max drawdown histogram edges: 0% to 100% in 0.1% steps
+DRAWDOWN_EDGES = np.linspace(0, 1, 1001)
+
+# Percentiles reported for the FIRE age and max drawdown distributions
+PATH_PERCENTILES = [10, 25, 50, 75, 90]
+
+
+def path_statistics(savings_by_year, current_savings, target):
+    # From (years x trials) savings, returns
+    #   first-passage counts, (years + 2,): trials whose savings first reach target after
+    #       0, 1, ..., years years (0 = already there); the last entry counts trials that
+    #       do not reach it within the horizon
+    #   max drawdown counts, (len(DRAWDOWN_EDGES) - 1,): histogram of each trial's largest
+    #       fall from a previous year-end peak (starting from current_savings)
+    years, num_trials = savings_by_year.shape
+    first_year = np.full(num_trials, 0 if current_savings >= target else years + 1)
+    peak = np.full(num_trials, float(current_savings))
+    max_drawdown = np.zeros(num_trials)
+    drawdown = np.empty(num_trials)
+    for year in range(years):
+        savings = savings_by_year[year]
+        first_year[(first_year > year + 1) & (savings >= target)] = year + 1
+        np.maximum(peak, savings, out=peak)
+        np.divide(savings, peak, out=drawdown, where=peak > 0)
+        drawdown[peak <= 0] = 1
+        np.subtract(1, drawdown, out=drawdown)
+        np.maximum(max_drawdown, drawdown, out=max_drawdown)
+    np.clip(max_drawdown, 0, 1, out=max_drawdown)
+    return (
+        np.bincount(first_year, minlength=years + 2),
+        np.histogram(max_drawdown, DRAWDOWN_EDGES)[0],
+    )
+
+
+def _count_percentiles(counts, values, percentiles):
+    cumulative = np.cumsum(counts) / counts.sum()
+    indices = np.searchsorted(cumulative, np.asarray(percentiles) / 100 - 1e-12)
+    return values[np.minimum(indices, len(values) - 1)]
+
+
+def fire_year_percentiles(fire_year_counts, percentiles=PATH_PERCENTILES):
+    # Years until the target is first reached; np.inf where it is not within the horizon
+    years = np.arange(len(fire_year_counts), dtype=float)
+    years[-1] = np.inf
+    return _count_percentiles(fire_year_counts, years, percentiles)
+
+
+def drawdown_percentiles(drawdown_counts, percentiles=PATH_PERCENTILES):
+    # Max drawdown (fraction) at the upper edge of its histogram bin
+    return _count_percentiles(drawdown_counts, DRAWDOWN_EDGES[1:], percentiles)
@@ -0,0 +1,66 @@
+import numpy as np
+
+
+class QuantileSketch:
+    # Log-bucketed histogram per series (DDSketch style). Any quantile it returns is
+    # within relative_accuracy of a real sample value, and memory is fixed by the
+    # bucket range rather than by the number of values added.
+    # Values with |x| below min_value are counted as zero; values above max_value
+    # land in the last bucket.
+
+    def __init__(self, num_series, relative_accuracy=0.005, min_value=1.0, max_value=1e15):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.num_series = num_series
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = np.log(self.gamma)
+        self.min_index = int(np.ceil(np.log(min_value) / self.log_gamma))
+        self.num_buckets = int(np.ceil(np.log(max_value) / self.log_gamma)) - self.min_index + 1
+        self.positive = np.zeros((num_series, self.num_buckets), dtype=np.int64)
+        self.negative = np.zeros((num_series, self.num_buckets), dtype=np.int64)
+        self.zero = np.zeros(num_series, dtype=np.int64)
+
+    @property
+    def count(self):
+        return self.positive.sum(axis=1) + self.negative.sum(axis=1) + self.zero
+
+    def _bucket_counts(self, magnitudes, rows):
+        index = np.ceil(np.log(magnitudes) / self.log_gamma).astype(np.int64) - self.min_index
+        np.clip(index, 0, self.num_buckets - 1, out=index)
+        flat = rows * self.num_buckets + index
+        return np.bincount(flat, minlength=self.num_series * self.num_buckets).reshape(self.num_series, self.num_buckets)
+
+    def add(self, values):
+        # values is (num_series x n): row i is added to series i
+        values = np.asarray(values, dtype=float)
+        rows = np.broadcast_to(np.arange(self.num_series)[:, None], values.shape)
+        positive = values >= self.min_value
+        negative = values <= -self.min_value
+        self.positive += self._bucket_counts(values[positive], rows[positive])
+        self.negative += self._bucket_counts(-values[negative], rows[negative])
+        self.zero += values.shape[1] - positive.sum(axis=1) - negative.sum(axis=1)
+
+    def merge(self, other):
+        if (other.num_series, other.num_buckets, other.relative_accuracy) != (self.num_series, self.num_buckets, self.relative_accuracy):
+            raise ValueError("Can only merge sketches with the same shape and accuracy")
+        self.positive += other.positive
+        self.negative += other.negative
+        self.zero += other.zero
+
+    def quantile(self, percentiles):
+        # Returns a (len(percentiles) x num_series) array, like np.percentile(values, percentiles, axis=1)
+        bucket_values = 2 * self.gamma ** (np.arange(self.num_buckets) + self.min_index) / (self.gamma + 1)
+        # Buckets in ascending value order: negatives (largest magnitude first), zero, positives
+        counts = np.concatenate([self.negative[:, ::-1], self.zero[:, None], self.positive], axis=1)
+        values = np.concatenate([-bucket_values[::-1], [0.0], bucket_values])
+        cumulative = np.cumsum(counts, axis=1)
+        total = cumulative[:, -1]
+        estimates = np.empty((len(percentiles), self.num_series))
+        for i, percentile in enumerate(percentiles):
+            rank = percentile / 100 * (total - 1)
+            estimates[i] = values[np.argmax(cumulative > rank[:, None], axis=1)]
+        estimates[:, total == 0] = np.nan
+        return estimates
@@ -0,0 +1,291 @@
+import argparse
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Rent vs. buy math without any Streamlit calls. calculate_rent_vs_buy broadcasts over
+# NumPy arrays, so a whole file of listings is one column-wise pass:
+#
+#     python -m utils.rent_vs_buy listings.csv results.csv --keep "Listing ID"
+#
+# Each row needs the columns of the sample CSV on the page (rates in %). Any of the
+# assumption columns below override the defaults for that row.
+
+# CSV column: (calculate_rent_vs_buy argument, divisor to a fraction)
+LISTING_COLUMNS = {
+    "Home Price": ("home_price", 1),
+    "Monthly Rent": ("monthly_rent", 1),
+    "Stay Duration": ("stay_duration", 1),
+    "Mortgage Rate": ("mortgage_rate", 100),
+    "Down Payment": ("down_payment", 100),
+    "Mortgage Term": ("mortgage_term", 1),
+}
+ASSUMPTION_COLUMNS = {
+    "Investment Return": ("investment_return", 100),
+    "Home Price Growth Rate": ("home_price_growth_rate", 100),
+    "Rental Growth Rate": ("rental_growth_rate", 100),
+    "Cost of Buying": ("cost_of_buying", 100),
+    "Cost of Selling": ("cost_of_selling", 100),
+    "Maintenance Cost": ("maintenance_cost", 100),
+}
+
+# Fractions, matching the page's default assumptions
+DEFAULT_ASSUMPTIONS = dict(
+    investment_return=0.09, home_price_growth_rate=0.04, rental_growth_rate=0.03,
+    cost_of_buying=0.045, cost_of_selling=0.08, maintenance_cost=0.02,
+)
+DEFAULT_CHUNK_ROWS = 250_000
+
+
+@dataclass
+class RentVsBuyCosts:
+    total_renting_cost: float
+    total_buying_cost: float
+    initial_rent_cost: float
+    initial_buy_cost: float
+    annual_future_value_rent: float
+    annual_future_value_buy_recurring: float
+    net_proceeds: float
+    annual_mortgage_payment: float
+    annual_maintenance_cost: float
+    annual_recurring_rent: float
+    total_recurring_rent: float
+    annual_recurring_buy: float
+    total_recurring_buy: float
+    future_value_buy_initial: float
+
+
+# calculate_rent_vs_buy's inputs, in order
+RENT_VS_BUY_INPUTS = [
+    "home_price", "monthly_rent", "stay_duration", "mortgage_rate", "down_payment", "mortgage_term",
+    "investment_return", "home_price_growth_rate", "rental_growth_rate", "cost_of_buying", "cost_of_selling", "maintenance_cost",
+]
+
+
+def _growth_sum(rate, periods):
+    # ((1 + rate) ** periods - 1) / rate, which is periods at rate 0
+    rate, periods = np.broadcast_arrays(np.asarray(rate, dtype=float), np.asarray(periods, dtype=float))
+    return np.divide((1 + rate) ** periods - 1, rate, out=periods.copy(), where=rate != 0)
+
+
+def calculate_rent_vs_buy(home_price, monthly_rent, stay_duration, mortgage_rate, down_payment, mortgage_term, investment_return, home_price_growth_rate, rental_growth_rate, cost_of_buying, cost_of_selling, maintenance_cost):
+    # Rates are fractions. Every argument may be an array; scalars give scalar costs.
+    # Zero rates (rent growth, mortgage, investment return) use their limits rather than
+    # dividing by zero.
+    stay_duration = np.asarray(stay_duration, dtype=float)
+
+    # Step 1: Calculate initial costs
+    initial_rent_cost = monthly_rent
+    initial_buy_cost = down_payment * home_price + cost_of_buying * home_price
+
+    # Step 2: Calculate recurring costs
+    annual_recurring_rent = monthly_rent * 12
+    total_recurring_rent = annual_recurring_rent * _growth_sum(rental_growth_rate, stay_duration)
+
+    annual_mortgage_payment = (home_price * (1 - down_payment)) / _growth_sum(mortgage_rate, mortgage_term) * (1 + np.asarray(mortgage_rate)) ** mortgage_term
+    annual_maintenance_cost = maintenance_cost * home_price
+    annual_recurring_buy = annual_mortgage_payment + annual_maintenance_cost
+    total_recurring_buy = annual_recurring_buy * stay_duration
+
+    # Step 3: Calculate opportunity costs. Rent grows while it is invested: the sum of
+    # (1 + g) ** k * (1 + i) ** (n - k), which is n * (1 + i) ** (n - 1) when i == g
+    investment_growth = (1 + np.asarray(investment_return, dtype=float)) ** stay_duration
+    rental_growth = (1 + np.asarray(rental_growth_rate, dtype=float)) ** stay_duration
+    rate_gap = np.asarray(investment_return, dtype=float) - np.asarray(rental_growth_rate, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        future_value_rent = annual_recurring_rent * np.where(
+            rate_gap != 0,
+            (investment_growth - rental_growth) / rate_gap,
+            stay_duration * investment_growth / (1 + np.asarray(investment_return)),
+        )
+        future_value_buy_initial = initial_buy_cost * investment_growth
+        future_value_buy_recurring = annual_recurring_buy * _growth_sum(investment_return, stay_duration)
+
+        # Annualize opportunity costs
+        annual_future_value_rent = future_value_rent / stay_duration
+        annual_future_value_buy_recurring = future_value_buy_recurring / stay_duration
+
+    # Step 4: Calculate net proceeds
+    future_home_price = home_price * (1 + np.asarray(home_price_growth_rate)) ** stay_duration
+    net_proceeds = future_home_price - cost_of_selling * future_home_price
+
+    # Step 5: Calculate total costs
+    total_renting_cost = initial_rent_cost + total_recurring_rent + future_value_rent
+    total_buying_cost = initial_buy_cost + total_recurring_buy + future_value_buy_initial + future_value_buy_recurring - net_proceeds
+
+    return RentVsBuyCosts(*(np.asarray(value, dtype=float)[()] for value in (
+        total_renting_cost, total_buying_cost, initial_rent_cost, initial_buy_cost, annual_future_value_rent,
+        annual_future_value_buy_recurring, net_proceeds, annual_mortgage_payment, annual_maintenance_cost,
+        annual_recurring_rent, total_recurring_rent, annual_recurring_buy, total_recurring_buy, future_value_buy_initial,
+    )))
+
+
+def break_even_mortgage_rates(home_price, monthly_rent, stay_duration, down_payment, mortgage_term, investment_return, home_price_growth_rate, rental_growth_rate, cost_of_buying, cost_of_selling, maintenance_cost, low=0.0, high=0.2, tolerance=1e-7):
+    # Mortgage rate (fraction) at which renting and buying cost the same, for every
+    # scenario at once; np.nan where no rate in [low, high] breaks even. Buying cost is
+    # linear in the annual mortgage payment, so costs are evaluated once, at low, to get
+    # the payment that breaks even; array bisection then finds the rate with that payment.
+    costs = calculate_rent_vs_buy(home_price, monthly_rent, stay_duration, low, down_payment, mortgage_term, investment_return, home_price_growth_rate, rental_growth_rate, cost_of_buying, cost_of_selling, maintenance_cost)
+    # Each extra $1 of annual payment adds $1 a year plus its invested value to buying
+    payment_weight = np.asarray(stay_duration, dtype=float) + _growth_sum(investment_return, stay_duration)
+    # With no years of stay no payment is ever made, so no rate breaks even (NaN)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        break_even_payment = np.where(
+            payment_weight > 0,
+            costs.annual_mortgage_payment + (costs.total_renting_cost - costs.total_buying_cost) / payment_weight,
+            np.nan,
+        )
+    principal = home_price * (1 - np.asarray(down_payment, dtype=float))
+
+    def mortgage_payment(rate):
+        return principal / _growth_sum(rate, mortgage_term) * (1 + rate) ** mortgage_term
+
+    shape = np.shape(break_even_payment)
+    lower = np.full(shape, float(low))
+    upper = np.full(shape, float(high))
+    # The payment rises with the rate, so a root exists when the break-even payment is
+    # within the payments at the two ends of the bracket
+    in_bracket = (costs.annual_mortgage_payment <= break_even_payment) & (break_even_payment <= mortgage_payment(upper))
+    for _ in range(max(1, int(np.ceil(np.log2((high - low) / tolerance))))):
+        middle = (lower + upper) / 2
+        below = mortgage_payment(middle) < break_even_payment
+        lower = np.where(below, middle, lower)
+        upper = np.where(below, upper, middle)
+    return np.where(in_bracket, (lower + upper) / 2, np.nan)[()]
+
+
+@dataclass
+class SweepCube:
+    # Costs over the Cartesian product of axes, one array dimension per axis in order
+    axes: dict  # argument name: 1-D values
+    total_renting_cost: np.ndarray
+    total_buying_cost: np.ndarray
+
+    @property
+    def dims(self):
+        return list(self.axes)
+
+    def sel(self, **values):
+        # Cube with the named axes fixed at the grid value nearest each given value and
+        # dropped, e.g. cube.sel(stay_duration=10)
+        unknown = [name for name in values if name not in self.axes]
+        if unknown:
+            raise ValueError(f"Not axes of this sweep: {', '.join(unknown)}")
+        index = tuple(
+            int(np.abs(axis_values - values[name]).argmin()) if name in values else slice(None)
+            for name, axis_values in self.axes.items()
+        )
+        return SweepCube(
+            {name: axis_values for name, axis_values in self.axes.items() if name not in values},
+            self.total_renting_cost[index],
+            self.total_buying_cost[index],
+        )
+
+    def indifference_points(self):
+        # For a sweep over exactly two axes: points on the curve where renting and buying
+        # cost the same, found by contouring the cost difference. Wherever the cheaper
+        # option changes between neighbouring cells along either axis, the crossing is
+        # linearly interpolated between them. Returns a frame with a column per axis.
+        if len(self.axes) != 2:
+            raise ValueError("Indifference points need a sweep over exactly two axes")
+        shape = tuple(len(values) for values in self.axes.values())
+        difference = np.broadcast_to(self.total_renting_cost - self.total_buying_cost, shape)
+        grids = np.meshgrid(*self.axes.values(), indexing="ij")
+        crossings = {name: [] for name in self.axes}
+        for axis in range(2):
+            start = tuple(slice(None, -1) if dimension == axis else slice(None) for dimension in range(2))
+            end = tuple(slice(1, None) if dimension == axis else slice(None) for dimension in range(2))
+            before, after = difference[start], difference[end]
+            crossing = (before * after <= 0) & (before != after)
+            fraction = before[crossing] / (before - after)[crossing]
+            for name, grid in zip(self.axes, grids):
+                crossings[name].append(grid[start][crossing] + (grid[end][crossing] - grid[start][crossing]) * fraction)
+        points = pd.DataFrame({name: np.concatenate(values) for name, values in crossings.items()})
+        return points.drop_duplicates().sort_values(list(self.axes), ignore_index=True)
+
+    def to_frame(self):
+        # One row per cell: a column per axis, then both costs
+        grids = np.meshgrid(*self.axes.values(), indexing="ij")
+        return pd.DataFrame({
+            **{name: grid.ravel() for name, grid in zip(self.axes, grids)},
+            "total_renting_cost": self.total_renting_cost.ravel(),
+            "total_buying_cost": self.total_buying_cost.ravel(),
+        })
+
+
+def sweep_rent_vs_buy(axes, **fixed):
+    # calculate_rent_vs_buy over every combination of axes ({argument name: values}, any
+    # subset of RENT_VS_BUY_INPUTS) in one broadcast, with the other inputs in fixed.
+    # Each axis gets its own dimension, so a cube of 10 ** 6 cells is a single pass.
+    unknown = [name for name in [*axes, *fixed] if name not in RENT_VS_BUY_INPUTS]
+    missing = [name for name in RENT_VS_BUY_INPUTS if name not in axes and name not in fixed]
+    if unknown or missing:
+        raise ValueError(f"Unknown inputs: {', '.join(unknown) or 'none'}; missing inputs: {', '.join(missing) or 'none'}")
+    axes = {name: np.asarray(values, dtype=float).ravel() for name, values in axes.items()}
+    arguments = dict(fixed)
+    for dimension, (name, values) in enumerate(axes.items()):
+        arguments[name] = values.reshape((-1,) + (1,) * (len(axes) - dimension - 1))
+    costs = calculate_rent_vs_buy(**arguments)
+    shape = tuple(len(values) for values in axes.values())
+    return SweepCube(axes, np.broadcast_to(costs.total_renting_cost, shape), np.broadcast_to(costs.total_buying_cost, shape))
+
+
+def evaluate_listings(listings, assumptions=DEFAULT_ASSUMPTIONS):
+    # calculate_rent_vs_buy and break_even_mortgage_rates over every row of a DataFrame in
+    # the sample CSV layout. assumptions (fractions) apply to rows without their own
+    # assumption columns.
+    missing = [column for column in LISTING_COLUMNS if column not in listings.columns]
+    if missing:
+        raise ValueError(f"Listings are missing columns: {', '.join(missing)}")
+    arguments = dict(assumptions)
+    for column, (argument, divisor) in {**LISTING_COLUMNS, **ASSUMPTION_COLUMNS}.items():
+        if column in listings.columns:
+            arguments[argument] = listings[column].to_numpy(dtype=float) / divisor
+    costs = calculate_rent_vs_buy(**arguments)
+    total_renting_cost = np.broadcast_to(costs.total_renting_cost, len(listings))
+    total_buying_cost = np.broadcast_to(costs.total_buying_cost, len(listings))
+    arguments.pop("mortgage_rate")
+    return pd.DataFrame({
+        "Total Renting Cost": total_renting_cost,
+        "Total Buying Cost": total_buying_cost,
+        "Decision": np.where(total_renting_cost < total_buying_cost, "Rent", "Buy"),
+        # % (NaN where no rate from 0% to 20% breaks even)
+        "Break-even Mortgage Rate": np.broadcast_to(break_even_mortgage_rates(**arguments), len(listings)) * 100,
+    }, index=listings.index)
+
+
+def iter_batch(in_path, assumptions=DEFAULT_ASSUMPTIONS, chunk_rows=DEFAULT_CHUNK_ROWS, keep_columns=()):
+    # evaluate_listings over a CSV of listings (a path or file-like), chunk_rows at a time,
+    # yielding each chunk's results with any keep_columns (e.g. a listing id) in front
+    for listings in pd.read_csv(in_path, chunksize=chunk_rows):
+        yield pd.concat([listings[list(keep_columns)], evaluate_listings(listings, assumptions)], axis=1)
+
+
+def run_batch(in_path, out_path, assumptions=DEFAULT_ASSUMPTIONS, chunk_rows=DEFAULT_CHUNK_ROWS, keep_columns=()):
+    # Stream a CSV of listings through evaluate_listings into a results CSV, keeping any
+    # keep_columns. Returns the number of rows.
+    num_rows = 0
+    for results in iter_batch(in_path, assumptions, chunk_rows, keep_columns):
+        results.to_csv(out_path, mode="a" if num_rows else "w", header=not num_rows, index=False)
+        num_rows += len(results)
+    return num_rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate rent vs. buy for every listing in a CSV file")
+    parser.add_argument("in_path")
+    parser.add_argument("out_path")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--keep", nargs="*", default=[], help="Input columns to copy into the results, e.g. a listing id")
+    for column, (argument, _) in ASSUMPTION_COLUMNS.items():
+        parser.add_argument(f"--{argument.replace('_', '-')}", type=float, default=DEFAULT_ASSUMPTIONS[argument] * 100, help=f"{column} (%%) for rows without that column")
+    args = parser.parse_args(argv)
+
+    assumptions = {argument: getattr(args, argument) / 100 for argument, _ in ASSUMPTION_COLUMNS.values()}
+    num_rows = run_batch(args.in_path, args.out_path, assumptions, args.chunk_rows, args.keep)
+    print(f"Wrote {num_rows:,} results to {args.out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import argparse
+import dataclasses
+import hashlib
+import io
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+import numpy as np
+
+from utils.simulation import SimulationResult, iter_monte_carlo
+
+# Simulation results cached on disk, shared by every session and server process. Entries
+# are keyed by a hash of the canonical simulation parameters and seed, stored as compressed
+# arrays in SQLite, and evicted least recently used once the cache grows past max_bytes.
+# Hit, miss and eviction counters are kept in the same database:
+#
+#     python -m utils.result_cache stats
+CACHE_PATH = Path(__file__).resolve().parent.parent / "data" / "result_cache.sqlite"
+DEFAULT_MAX_BYTES = 256 * 1024 ** 2
+
+# Bump when a change to the engine alters results for the same parameters and seed
+CACHE_VERSION = 4
+
+# Key used for "any seed" in place of a seed, so runs without a fixed seed are shared
+ANY_SEED = "any"
+
+
+def _canonical(value):
+    # JSON-serializable form of a parameter with a stable representation; arrays are
+    # reduced to a digest of their contents and models to their class and attributes
+    if isinstance(value, np.ndarray):
+        array = np.ascontiguousarray(value)
+        return {"dtype": str(array.dtype), "shape": list(array.shape), "sha256": hashlib.sha256(array.tobytes()).hexdigest()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in value.items()}
+    if isinstance(value, np.generic):
+        return value.item()
+    if dataclasses.is_dataclass(value):
+        return {"type": type(value).__name__, **_canonical(dataclasses.asdict(value))}
+    if hasattr(value, "__dict__"):
+        return {"type": type(value).__name__, **_canonical(vars(value))}
+    return value
+
+
+def cache_key(name, params, seed):
+    payload = {"name": name, "version": CACHE_VERSION, "params": _canonical(params), "seed": seed}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def _encode(result):
+    # Array fields go into a compressed .npz, everything else into its JSON header
+    arrays = {}
+    fields = {}
+    for field in dataclasses.fields(result):
+        value = getattr(result, field.name)
+        if isinstance(value, np.ndarray):
+            arrays[field.name] = value
+        else:
+            fields[field.name] = value.item() if isinstance(value, np.generic) else value
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, __fields__=np.array(json.dumps(fields)), **arrays)
+    return buffer.getvalue()
+
+
+def _decode(blob, result_type):
+    with np.load(io.BytesIO(blob)) as data:
+        values = json.loads(str(data["__fields__"]))
+        values.update({name: data[name] for name in data.files if name != "__fields__"})
+    return result_type(**values)
+
+
+class ResultCache:
+    # Every call opens its own connection, so one instance can be shared across threads
+    # and processes can use the same file concurrently
+
+    def __init__(self, path=CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)")
+            connection.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            connection.executemany("INSERT OR IGNORE INTO counters VALUES (?, 0)", [("hits",), ("misses",), ("evictions",)])
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _count(self, connection, name, amount=1):
+        connection.execute("UPDATE counters SET value = value + ? WHERE name = ?", (amount, name))
+
+    def get(self, key, result_type=SimulationResult):
+        # The cached result, or None on a miss
+        with self._connect() as connection:
+            row = connection.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._count(connection, "misses")
+                return None
+            connection.execute("UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._count(connection, "hits")
+        return _decode(row[0], result_type)
+
+    def put(self, keys, result):
+        # Store result under one or more keys, then evict the least recently used entries
+        # until the cache fits in max_bytes
+        blob = _encode(result)
+        now = time.time()
+        with self._connect() as connection:
+            connection.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", [(key, blob, len(blob), now) for key in keys])
+            total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            evicted = 0
+            for key, size in connection.execute("SELECT key, size FROM results ORDER BY last_access").fetchall():
+                if total <= self.max_bytes:
+                    break
+                connection.execute("DELETE FROM results WHERE key = ?", (key,))
+                total -= size
+                evicted += 1
+            self._count(connection, "evictions", evicted)
+
+    def stats(self):
+        with self._connect() as connection:
+            counters = dict(connection.execute("SELECT name, value FROM counters").fetchall())
+            counters["entries"], counters["bytes"] = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_rate"] = counters["hits"] / lookups if lookups else 0.0
+        return counters
+
+    def clear(self):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM results")
+            connection.execute("UPDATE counters SET value = 0")
+
+
+def run_monte_carlo_cached(cache, current_savings, annual_savings, years, weights, return_model, inflation_rate, num_trials, seed=None, workers=1, reuse_any_seed=True, **options):
+    # run_monte_carlo through the cache. Without a seed, any earlier run of the same
+    # parameters is reused (its seed is on the result) unless reuse_any_seed is False.
+    # workers is left out of the key because results do not depend on it.
+    for result in iter_monte_carlo_cached(cache, current_savings, annual_savings, years, weights, return_model, inflation_rate, num_trials, seed, workers, reuse_any_seed, **options):
+        pass
+    return result
+
+
+def iter_monte_carlo_cached(cache, current_savings, annual_savings, years, weights, return_model, inflation_rate, num_trials, seed=None, workers=1, reuse_any_seed=True, **options):
+    # iter_monte_carlo through the cache: yields the cached result alone on a hit, otherwise
+    # every provisional result and caches the final one
+    params = dict(
+        current_savings=current_savings, annual_savings=annual_savings, years=years, weights=np.asarray(weights, dtype=float),
+        return_model=return_model, inflation_rate=inflation_rate, num_trials=num_trials, **options,
+    )
+    if seed is not None or reuse_any_seed:
+        result = cache.get(cache_key("run_monte_carlo", params, ANY_SEED if seed is None else int(seed)))
+        if result is not None:
+            yield result
+            return
+    for result in iter_monte_carlo(seed=seed, workers=workers, **params):
+        yield result
+    keys = [cache_key("run_monte_carlo", params, result.seed)]
+    if seed is None:
+        keys.append(cache_key("run_monte_carlo", params, ANY_SEED))
+    cache.put(keys, result)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or clear the simulation result cache")
+    parser.add_argument("command", choices=["stats", "clear"])
+    parser.add_argument("--path", default=str(CACHE_PATH))
+    args = parser.parse_args(argv)
+
+    cache = ResultCache(args.path)
+    if args.command == "clear":
+        cache.clear()
+    stats = cache.stats()
+    print(f"{stats['entries']} entries, {stats['bytes'] / 1024 ** 2:.1f} MiB")
+    print(f"hits {stats['hits']}, misses {stats['misses']}, hit rate {stats['hit_rate']:.1%}, evictions {stats['evictions']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+import numpy as np
+
+# Return models draw a (trials x years x assets) tensor of annual returns (fractions)
+# from a np.random.Generator in one batch. Models whose portfolio return has a closed-form
+# distribution also offer sample_portfolio, which draws the weighted (trials x years)
+# portfolio returns directly, so its cost does not depend on the number of assets.
+# Gaussian models also offer portfolio_from_normals, which maps standard normal shocks to
+# portfolio returns so the engine can supply antithetic or quasi-random shocks, and
+# portfolio_mean, the expected portfolio return for a set of weights. per_period gives the
+# equivalent model for shorter periods (12 for monthly), used by the monthly engine.
+# Models with fat tails or dependence between years (StudentTReturns,
+# RegimeSwitchingReturns, GarchReturns) take the same means and covariance as
+# CorrelatedNormalReturns, so any allocation can be simulated under each of them.
+
+
+class NormalReturns:
+    # Independent normal returns per asset
+
+    def __init__(self, means, std_devs):
+        self.means = np.asarray(means, dtype=float)
+        self.std_devs = np.asarray(std_devs, dtype=float)
+
+    @property
+    def num_assets(self):
+        return len(self.means)
+
+    def sample(self, rng, num_trials, years):
+        returns = rng.standard_normal((num_trials, years, self.num_assets))
+        returns *= self.std_devs
+        returns += self.means
+        return returns
+
+    def portfolio_mean(self, weights):
+        return float(np.asarray(weights, dtype=float) @ self.means)
+
+    def portfolio_from_normals(self, normals, weights):
+        weights = np.asarray(weights, dtype=float)
+        returns = normals * np.sqrt(weights ** 2 @ self.std_devs ** 2)
+        returns += weights @ self.means
+        return returns
+
+    def sample_portfolio(self, rng, num_trials, years, weights):
+        return self.portfolio_from_normals(rng.standard_normal((num_trials, years)), weights)
+
+    def per_period(self, periods_per_year):
+        # Means compound to the annual means; variance scales with time
+        return NormalReturns((1 + self.means) ** (1 / periods_per_year) - 1, self.std_devs / np.sqrt(periods_per_year))
+
+
+class CorrelatedNormalReturns:
+    # Multivariate normal returns from a covariance matrix. The matrix is factored once,
+    # and each batch is a single matmul of independent normals with the factor.
+
+    def __init__(self, means, covariance):
+        self.means = np.asarray(means, dtype=float)
+        self.covariance = np.asarray(covariance, dtype=float)
+        self.factor = covariance_factor(self.covariance)
+
+    @property
+    def num_assets(self):
+        return len(self.means)
+
+    def sample(self, rng, num_trials, years):
+        shocks = rng.standard_normal((num_trials, years, self.num_assets))
+        returns = shocks @ self.factor.T
+        returns += self.means
+        return returns
+
+    def portfolio_mean(self, weights):
+        return float(np.asarray(weights, dtype=float) @ self.means)
+
+    def portfolio_from_normals(self, normals, weights):
+        # A weighted sum of correlated normals is normal with standard deviation |F.T @ w|
+        weights = np.asarray(weights, dtype=float)
+        returns = normals * np.linalg.norm(self.factor.T @ weights)
+        returns += weights @ self.means
+        return returns
+
+    def sample_portfolio(self, rng, num_trials, years, weights):
+        return self.portfolio_from_normals(rng.standard_normal((num_trials, years)), weights)
+
+    def per_period(self, periods_per_year):
+        return CorrelatedNormalReturns((1 + self.means) ** (1 / periods_per_year) - 1, self.covariance / periods_per_year)
+
+
+def covariance_factor(covariance):
+    # Factor F with F @ F.T == covariance, normally the Cholesky factor. Singular or
+    # slightly indefinite matrices (zero-volatility assets, hand-edited correlations) fall
+    # back to an eigendecomposition with negative eigenvalues clipped to zero.
+    try:
+        return np.linalg.cholesky(covariance)
+    except np.linalg.LinAlgError:
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        return eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))
+
+
+class StudentTReturns:
+    # Multivariate Student-t returns: correlated normals divided by one shared
+    # sqrt(chi-square / dof) draw per trial and year, scaled so the covariance is
+    # unchanged. Extreme years are far more likely than under a normal model and hit every
+    # asset together; lower degrees_of_freedom (above 2) means fatter tails.
+
+    def __init__(self, means, covariance, degrees_of_freedom=5.0):
+        if degrees_of_freedom <= 2:
+            raise ValueError("Student-t returns need more than 2 degrees of freedom for a finite variance")
+        self.means = np.asarray(means, dtype=float)
+        self.covariance = np.asarray(covariance, dtype=float)
+        self.degrees_of_freedom = float(degrees_of_freedom)
+        self.factor = covariance_factor(self.covariance)
+
+    @property
+    def num_assets(self):
+        return len(self.means)
+
+    def _scales(self, rng, shape):
+        # Unit-variance t = z * sqrt((dof - 2) / chi-square(dof))
+        return np.sqrt((self.degrees_of_freedom - 2) / rng.chisquare(self.degrees_of_freedom, shape))
+
+    def sample(self, rng, num_trials, years):
+        returns = rng.standard_normal((num_trials, years, self.num_assets)) @ self.factor.T
+        returns *= self._scales(rng, (num_trials, years))[..., None]
+        returns += self.means
+        return returns
+
+    def portfolio_mean(self, weights):
+        return float(np.asarray(weights, dtype=float) @ self.means)
+
+    def sample_portfolio(self, rng, num_trials, years, weights):
+        # A weighted sum of a multivariate t is t with the portfolio's scale
+        weights = np.asarray(weights, dtype=float)
+        returns = rng.standard_normal((num_trials, years))
+        returns *= self._scales(rng, (num_trials, years))
+        returns *= np.linalg.norm(self.factor.T @ weights)
+        returns += weights @ self.means
+        return returns
+
+    def per_period(self, periods_per_year):
+        return StudentTReturns((1 + self.means) ** (1 / periods_per_year) - 1, self.covariance / periods_per_year, self.degrees_of_freedom)
+
+
+def stationary_distribution(transition):
+    # Long-run share of time in each state of a Markov chain with transition[from, to]
+    eigenvalues, eigenvectors = np.linalg.eig(np.asarray(transition, dtype=float).T)
+    stationary = np.real(eigenvectors[:, np.argmin(np.abs(eigenvalues - 1))])
+    return stationary / stationary.sum()
+
+
+def regime_covariances(covariance, means, transition, volatility_multipliers):
+    # (states x assets x assets) covariances proportional to volatility_multipliers ** 2
+    # whose long-run mixture, including the spread between the state means, equals
+    # covariance. If the spread of the means alone exceeds an asset's variance, the
+    # within-state part is clipped to the nearest positive semi-definite matrix and the
+    # long-run volatility comes out above covariance's.
+    means = np.asarray(means, dtype=float)
+    stationary = stationary_distribution(transition)
+    deviations = means - stationary @ means
+    within = np.asarray(covariance, dtype=float) - np.einsum("s,sa,sb->ab", stationary, deviations, deviations)
+    eigenvalues, eigenvectors = np.linalg.eigh(within)
+    within = (eigenvectors * np.clip(eigenvalues, 0, None)) @ eigenvectors.T
+    scales = np.asarray(volatility_multipliers, dtype=float) ** 2
+    return scales[:, None, None] * within / (stationary @ scales)
+
+
+class RegimeSwitchingReturns:
+    # Markov regime switching, e.g. a calm and a crash state. Each trial starts in a state
+    # drawn from the long-run (stationary) distribution and moves between states every
+    # year with probabilities transition[from, to]; returns are multivariate normal with
+    # the current state's means (states x assets) and covariance (states x assets x assets).
+    # Bad years cluster, so long drawdowns are more likely than with independent years.
+
+    def __init__(self, means, covariances, transition):
+        self.means = np.asarray(means, dtype=float)
+        self.covariances = np.asarray(covariances, dtype=float)
+        self.transition = np.asarray(transition, dtype=float)
+        self.factors = np.array([covariance_factor(covariance) for covariance in self.covariances])
+
+    @property
+    def num_assets(self):
+        return self.means.shape[1]
+
+    @property
+    def stationary_distribution(self):
+        return stationary_distribution(self.transition)
+
+    def states(self, rng, num_trials, years):
+        # (trials x years) state indices. The chain is stepped once per year for all trials:
+        # the next state is the number of cumulative transition thresholds the draw passes.
+        thresholds = np.cumsum(self.transition, axis=1)[:, :-1]
+        draws = rng.random((years, num_trials))
+        states = np.empty((years, num_trials), dtype=np.intp)
+        states[0] = np.searchsorted(np.cumsum(self.stationary_distribution)[:-1], draws[0], side="right")
+        for year in range(1, years):
+            states[year] = 0
+            for threshold in thresholds.T:
+                states[year] += draws[year] >= threshold[states[year - 1]]
+        return states.T
+
+    def sample(self, rng, num_trials, years):
+        states = self.states(rng, num_trials, years)
+        returns = rng.standard_normal((num_trials, years, self.num_assets))
+        for state in range(len(self.means)):
+            in_state = states == state
+            returns[in_state] = returns[in_state] @ self.factors[state].T + self.means[state]
+        return returns
+
+    def portfolio_mean(self, weights):
+        return float(self.stationary_distribution @ self.means @ np.asarray(weights, dtype=float))
+
+    def sample_portfolio(self, rng, num_trials, years, weights):
+        # Within a state the portfolio return is normal, so only its mean and standard
+        # deviation per state are needed
+        weights = np.asarray(weights, dtype=float)
+        states = self.states(rng, num_trials, years)
+        returns = rng.standard_normal((num_trials, years))
+        returns *= np.linalg.norm(np.swapaxes(self.factors, 1, 2) @ weights, axis=1)[states]
+        returns += (self.means @ weights)[states]
+        return returns
+
+
+class GarchReturns:
+    # Constant-correlation GARCH(1,1): each asset's variance follows
+    #     h_t = omega + alpha * e_{t-1} ** 2 + beta * h_{t-1},  omega = sigma ** 2 * (1 - alpha - beta)
+    # around the variances on the diagonal of covariance, with shocks correlated as in
+    # covariance. A large move raises the volatility of the following years (volatility
+    # clustering). Trials start at the long-run variance.
+
+    def __init__(self, means, covariance, alpha=0.1, beta=0.85):
+        if alpha < 0 or beta < 0 or alpha + beta >= 1:
+            raise ValueError("GARCH(1,1) needs alpha, beta >= 0 and alpha + beta < 1")
+        self.means = np.asarray(means, dtype=float)
+        self.covariance = np.asarray(covariance, dtype=float)
+        self.alpha = float(alpha)
+        self.beta = float(beta)
+        self.variances = np.diag(self.covariance).copy()
+        scale = np.sqrt(np.where(self.variances > 0, self.variances, 1))
+        self.correlation_factor = covariance_factor(self.covariance / np.outer(scale, scale))
+
+    @property
+    def num_assets(self):
+        return len(self.means)
+
+    def sample(self, rng, num_trials, years):
+        returns = rng.standard_normal((num_trials, years, self.num_assets)) @ self.correlation_factor.T
+        omega = self.variances * (1 - self.alpha - self.beta)
+        variance = np.tile(self.variances, (num_trials, 1))
+        for year in range(years):
+            shocks = returns[:, year]
+            shocks *= np.sqrt(variance)
+            variance *= self.beta
+            variance += omega
+            variance += self.alpha * shocks ** 2
+        returns += self.means
+        return returns
+
+    def portfolio_mean(self, weights):
+        return float(np.asarray(weights, dtype=float) @ self.means)
+
+    def sample_portfolio(self, rng, num_trials, years, weights):
+        # The variances depend on each asset's own shocks, so the loop stays per asset, but
+        # only one year of shocks is held at a time: each year is reduced to the portfolio
+        # as soon as the variance update has used it. Returns are filled year by year into
+        # a (years x trials) array and handed back transposed.
+        weights = np.asarray(weights, dtype=float)
+        omega = self.variances * (1 - self.alpha - self.beta)
+        variance = np.tile(self.variances, (num_trials, 1))
+        volatility = np.empty_like(variance)
+        returns = np.empty((years, num_trials))
+        for year in range(years):
+            shocks = rng.standard_normal((num_trials, self.num_assets)) @ self.correlation_factor.T
+            shocks *= np.sqrt(variance, out=volatility)
+            np.matmul(shocks, weights, out=returns[year])
+            variance *= self.beta
+            variance += omega
+            np.square(shocks, out=shocks)
+            shocks *= self.alpha
+            variance += shocks
+        returns += weights @ self.means
+        return returns.T
+
+
+class BlockBootstrapReturns:
+    # Resamples blocks of consecutive historical periods (circular block bootstrap), so
+    # runs of good and bad years survive and sequence-of-returns risk is kept. history is
+    # a (periods x assets) array of returns, typically a memory-mapped ReturnHistory;
+    # monthly histories are compounded into annual returns.
+
+    def __init__(self, history, periods_per_year=1, block_years=5):
+        self.history = history
+        self.periods_per_year = periods_per_year
+        self.block_length = max(1, int(block_years * periods_per_year))
+
+    @property
+    def num_assets(self):
+        return self.history.shape[1]
+
+    def _indices(self, rng, num_trials, years):
+        # (trials x periods) indices into history, built with one integer draw per block
+        num_periods = years * self.periods_per_year
+        num_blocks = -(-num_periods // self.block_length)
+        starts = rng.integers(0, len(self.history), size=(num_trials, num_blocks, 1))
+        indices = (starts + np.arange(self.block_length)) % len(self.history)
+        return indices.reshape(num_trials, -1)[:, :num_periods]
+
+    def _to_annual(self, returns, years):
+        if self.periods_per_year == 1:
+            return returns
+        returns = returns.reshape(returns.shape[0], years, self.periods_per_year, *returns.shape[2:])
+        return np.prod(1 + returns, axis=2) - 1
+
+    def sample(self, rng, num_trials, years):
+        returns = np.asarray(self.history, dtype=float)[self._indices(rng, num_trials, years)]
+        return self._to_annual(returns, years)
+
+    def sample_portfolio(self, rng, num_trials, years, weights):
+        # Weight the (short) history once, then gather portfolio returns directly.
+        # Monthly histories are treated as rebalanced monthly.
+        portfolio_history = np.asarray(self.history, dtype=float) @ np.asarray(weights, dtype=float)
+        return self._to_annual(portfolio_history[self._indices(rng, num_trials, years)], years)
+
+    def per_period(self, periods_per_year):
+        # A monthly history can be resampled month by month; annual data has no finer steps
+        if periods_per_year != self.periods_per_year:
+            raise ValueError(f"A history with {self.periods_per_year} periods per year cannot be simulated at {periods_per_year} periods per year")
+        return BlockBootstrapReturns(self.history, 1, self.block_length)
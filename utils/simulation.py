@@ -0,0 +1,310 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+
+from utils.fire_plan import period_rate
+from utils.path_statistics import path_statistics
+from utils.quantiles import QuantileSketch
+from utils.variance_reduction import control_variate_percentiles, control_variates, standard_normals, t_critical
+
+# Percentiles shown on the FIRE page
+PERCENTILES = [10, 50, 90]
+
+# Trials simulated per chunk in streaming mode
+DEFAULT_CHUNK_SIZE = 50_000
+
+# Minimum number of independent chunks, used as replicates for percentile confidence intervals
+MIN_REPLICATES = 10
+
+# Chunks needed before a run may stop early on its confidence intervals
+MIN_STOPPING_CHUNKS = 5
+
+# Fewest trials worth a process pool: below a few full chunks, starting the workers costs
+# more than they save
+PARALLEL_MIN_TRIALS = 4 * DEFAULT_CHUNK_SIZE
+
+
+@dataclass
+class SimulationResult:
+    percentiles: np.ndarray  # (len(PERCENTILES) x years)
+    num_trials: int
+    seed: int  # Pass back to run_monte_carlo to reproduce the run
+    # Streaming mode only: guaranteed relative error of each percentile, and the largest
+    # relative gap between sketch and exact percentiles measured on the first chunk
+    error_bound: float = None
+    observed_error: float = None
+    # Half-width of the 95% confidence interval around each percentile, from the spread
+    # of the per-chunk estimates: (len(PERCENTILES) x years)
+    confidence_half_width: np.ndarray = None
+    # With a target only (see utils.path_statistics): trials first reaching the target
+    # after 0..years years plus those that never do, (years + 2,), and a histogram of each
+    # trial's max drawdown
+    fire_year_counts: np.ndarray = None
+    drawdown_counts: np.ndarray = None
+
+
+def sample_portfolio_returns(return_model, rng, num_trials, years, weights, sampling="random"):
+    # (trials x years) portfolio returns for fixed weights, rebalanced every year.
+    # sampling other than "random" (see utils.variance_reduction) needs a Gaussian model.
+    # A glide path (see utils.glide_path) gives weights as (years x assets), one row per
+    # year, and a stack of them (candidates x years x assets) gives (candidates x trials x
+    # years) returns, all weighting the same draw of asset returns.
+    weights = np.asarray(weights, dtype=float)
+    if weights.ndim > 1:
+        if sampling != "random":
+            raise ValueError("Glide paths only support random sampling")
+        return np.einsum("tya,...ya->...ty", return_model.sample(rng, num_trials, years), weights)
+    if sampling != "random":
+        if not hasattr(return_model, "portfolio_from_normals"):
+            raise ValueError(f"{type(return_model).__name__} only supports random sampling")
+        return return_model.portfolio_from_normals(standard_normals(rng, num_trials, years, sampling), weights)
+    if hasattr(return_model, "sample_portfolio"):
+        return return_model.sample_portfolio(rng, num_trials, years, weights)
+    return return_model.sample(rng, num_trials, years) @ weights
+
+
+def period_weights(weights, periods_per_year):
+    # Glide path rows are per year; repeat each for every period of its year
+    weights = np.asarray(weights, dtype=float)
+    return weights if weights.ndim == 1 else np.repeat(weights, periods_per_year, axis=-2)
+
+
+def per_period_inputs(return_model, weights, inflation_rate, periods_per_year):
+    # (per-period return model, per-period inflation) for stepping periods_per_year times
+    # a year. Inflation is set so the mean real portfolio return per period compounds to
+    # the annual mean minus inflation, the convention of fire_plan.future_savings; models
+    # without parametric means (historical returns) use inflation compounded per period.
+    # weights are annual (glide path rows per year), and the inflation broadcasts against
+    # (... x trials x periods) portfolio returns.
+    if periods_per_year == 1:
+        return return_model, inflation_rate
+    if not hasattr(return_model, "per_period"):
+        raise ValueError(f"{type(return_model).__name__} only supports annual steps")
+    period_model = return_model.per_period(periods_per_year)
+    if not hasattr(return_model, "means"):
+        return period_model, period_rate(inflation_rate, periods_per_year)
+    weights = np.asarray(weights, dtype=float)
+    period_inflation = weights @ period_model.means - period_rate(weights @ return_model.means - inflation_rate, periods_per_year)
+    if weights.ndim > 1:
+        period_inflation = np.repeat(period_inflation, periods_per_year, axis=-1)[..., None, :]
+    return period_model, period_inflation
+
+
+def evolve_savings(current_savings, annual_savings, portfolio_returns, periods_per_year=1, dtype=np.float64):
+    # Apply savings = savings * (1 + return) + annual_savings to every trial at once.
+    # Takes (trials x years) returns and gives back (years x trials) savings, so each
+    # year is a contiguous row. With periods_per_year (12 for monthly), returns are per
+    # period, annual_savings is paid in equal instalments every period and only year-end
+    # savings are kept. dtype=np.float32 halves the memory of the working arrays.
+    num_trials, num_periods = portfolio_returns.shape
+    growth = np.ascontiguousarray(portfolio_returns.T, dtype=dtype)
+    growth += 1
+    contribution = annual_savings / periods_per_year
+    savings_by_year = np.empty((num_periods // periods_per_year, num_trials), dtype=dtype)
+    total_savings = np.full(num_trials, current_savings, dtype=dtype)
+    for period in range(num_periods):
+        total_savings *= growth[period]
+        total_savings += contribution
+        if (period + 1) % periods_per_year == 0:
+            savings_by_year[period // periods_per_year] = total_savings
+    return savings_by_year
+
+
+def simulate_savings_by_year(current_savings, annual_savings, years, weights, return_model, inflation_rate, num_trials, rng=None):
+    # weights and inflation_rate are fractions (0.07 for 7%); return_model is one of
+    # the models in utils.return_models
+    if rng is None:
+        rng = np.random.default_rng()
+    portfolio_returns = sample_portfolio_returns(return_model, rng, num_trials, years, weights)
+    portfolio_returns -= inflation_rate
+    return evolve_savings(current_savings, annual_savings, portfolio_returns)
+
+
+def simulate_savings_paths(current_savings, annual_savings, years, weights, return_model, inflation_rate, num_trials, rng=None):
+    # (trials x years) savings paths
+    return simulate_savings_by_year(current_savings, annual_savings, years, weights, return_model, inflation_rate, num_trials, rng).T
+
+
+def simulate_percentiles(current_savings, annual_savings, years, weights, return_model, inflation_rate, num_trials, rng=None):
+    # Returns a (len(PERCENTILES), years) array of savings percentiles per year
+    savings_by_year = simulate_savings_by_year(current_savings, annual_savings, years, weights, return_model, inflation_rate, num_trials, rng)
+    return np.percentile(savings_by_year, PERCENTILES, axis=1)
+
+
+def new_seed():
+    # A short random seed that is easy to show to users and type back in
+    return int(np.random.SeedSequence().generate_state(1)[0])
+
+
+def chunk_sizes(num_trials, chunk_size=DEFAULT_CHUNK_SIZE):
+    return [min(chunk_size, num_trials - start) for start in range(0, num_trials, chunk_size)]
+
+
+def _run_chunk(task):
+    # Run chunk_function on one chunk of trials with its own seed substream
+    chunk_function, chunk_index, chunk_seed, chunk_trials, inputs = task
+    return chunk_function(chunk_index=chunk_index, rng=np.random.default_rng(chunk_seed), num_trials=chunk_trials, **inputs)
+
+
+def run_chunks(chunk_function, inputs, num_trials, seed=None, workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Trials are split into fixed-size chunks, each drawn from its own child of
+    # SeedSequence(seed).spawn(...). Chunks are the unit of randomness, not workers, so a
+    # given seed gives bit-identical results for any number of workers. chunk_function must
+    # be a module-level function so it can be sent to worker processes.
+    # Returns (chunk results in chunk order, seed). Every chunk result is kept, so callers
+    # that reduce chunks to a fixed-size summary should fold them in from iter_chunks.
+    if seed is None:
+        seed = new_seed()
+    return list(iter_chunks(chunk_function, inputs, num_trials, seed, workers, chunk_size)), seed
+
+
+def iter_chunks(chunk_function, inputs, num_trials, seed, workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    # run_chunks one chunk at a time: yields chunk results in chunk order as they finish.
+    # Closing the generator early cancels the chunks that have not started.
+    sizes = chunk_sizes(num_trials, chunk_size)
+    chunk_seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(chunk_function, i, chunk_seeds[i], sizes[i], inputs) for i in range(len(sizes))]
+
+    if workers > 1 and len(tasks) > 1:
+        executor = ProcessPoolExecutor(max_workers=min(workers, len(tasks)))
+        try:
+            yield from executor.map(_run_chunk, tasks)
+        finally:
+            executor.shutdown(cancel_futures=True)
+    else:
+        for task in tasks:
+            yield _run_chunk(task)
+
+
+def _monte_carlo_chunk(chunk_index, rng, num_trials, current_savings, annual_savings, years, weights, return_model, inflation_rate, sampling, control_variate, streaming, relative_accuracy, periods_per_year, dtype, target):
+    # Returns (savings by year or a sketch of them, this chunk's percentile estimate,
+    # sketch error measured on chunk 0, path statistics or None). return_model and
+    # inflation_rate are per period.
+    real_returns = sample_portfolio_returns(return_model, rng, num_trials, years * periods_per_year, weights, sampling)
+    real_returns -= inflation_rate
+    savings_by_year = evolve_savings(current_savings, annual_savings, real_returns, periods_per_year, dtype)
+    statistics = None if target is None else path_statistics(savings_by_year, current_savings, target)
+    if control_variate:
+        mean_real_return = return_model.portfolio_mean(weights) - inflation_rate
+        controls = control_variates(current_savings, annual_savings, real_returns, mean_real_return, periods_per_year)
+        return (savings_by_year, controls), control_variate_percentiles(savings_by_year, controls, PERCENTILES), None, statistics
+    if not streaming:
+        return savings_by_year, np.percentile(savings_by_year, PERCENTILES, axis=1), None, statistics
+    # The chunk's estimate is exact: sketch estimates snap to the same buckets across
+    # chunks, which would understate their spread
+    sketch = QuantileSketch(savings_by_year.shape[0], relative_accuracy)
+    sketch.add(savings_by_year)
+    observed_error = sketch_error(savings_by_year, relative_accuracy) if chunk_index == 0 else None
+    return sketch, np.percentile(savings_by_year, PERCENTILES, axis=1), observed_error, statistics
+
+
+def run_monte_carlo(current_savings, annual_savings, years, weights, return_model, inflation_rate, num_trials, seed=None, workers=1, streaming=False, sampling="random", control_variate=False, chunk_size=DEFAULT_CHUNK_SIZE, relative_accuracy=0.005, tolerance=None, periods_per_year=1, dtype="float64", target=None):
+    # Chunked, seeded simulation (see run_chunks). In streaming mode each chunk is folded
+    # into per-year quantile sketches, so peak memory does not grow with num_trials.
+    # sampling ("random", "antithetic", "sobol") and control_variate reduce the noise in
+    # the percentiles for Gaussian return models; control variates need exact mode.
+    # Trials are split into at least MIN_REPLICATES independent chunks, and the spread of
+    # their estimates gives a confidence interval for every percentile. See
+    # iter_monte_carlo for tolerance, periods_per_year, dtype and target.
+    for result in iter_monte_carlo(current_savings, annual_savings, years, weights, return_model, inflation_rate, num_trials, seed, workers, streaming, sampling, control_variate, chunk_size, relative_accuracy, tolerance, periods_per_year, dtype, target):
+        pass
+    return result
+
+
+def iter_monte_carlo(current_savings, annual_savings, years, weights, return_model, inflation_rate, num_trials, seed=None, workers=1, streaming=False, sampling="random", control_variate=False, chunk_size=DEFAULT_CHUNK_SIZE, relative_accuracy=0.005, tolerance=None, periods_per_year=1, dtype="float64", target=None):
+    # run_monte_carlo as it progresses: yields a provisional SimulationResult after each
+    # chunk and the final result last. Provisional percentiles are the mean of the chunk
+    # estimates so far (the merged sketch in streaming mode), so they cost nothing extra.
+    # With a tolerance (a fraction), the run stops once every percentile's 95% confidence
+    # half-width is within tolerance of the percentile; num_trials on the final result is
+    # then the number of trials actually run. A given seed and tolerance always stop at
+    # the same chunk.
+    # periods_per_year=12 steps monthly: returns are drawn per month from
+    # return_model.per_period with inflation from per_period_inputs, contributions are
+    # paid monthly, and chunks shrink by the same factor so a chunk's returns take the
+    # same memory as in the annual engine.
+    # dtype="float32" stores savings in single precision. weights may be a (years x assets)
+    # glide path, applied per year.
+    # With a target (e.g. the FIRE number), each chunk also reduces its paths to the
+    # first-passage and max drawdown histograms of utils.path_statistics, which are summed
+    # across chunks.
+    if control_variate and streaming:
+        raise ValueError("Control variates need every trial, so they cannot be combined with streaming mode")
+    if control_variate and np.ndim(weights) > 1:
+        raise ValueError("Control variates need fixed weights, so they cannot be combined with a glide path")
+    if control_variate and not hasattr(return_model, "portfolio_mean"):
+        raise ValueError(f"{type(return_model).__name__} does not support control variates")
+    if seed is None:
+        seed = new_seed()
+    return_model, inflation_rate = per_period_inputs(return_model, weights, inflation_rate, periods_per_year)
+    weights = period_weights(weights, periods_per_year)
+    chunk_size = max(1, min(chunk_size // periods_per_year, -(-num_trials // MIN_REPLICATES)))
+    sizes = chunk_sizes(num_trials, chunk_size)
+    inputs = dict(
+        current_savings=current_savings, annual_savings=annual_savings, years=years, weights=weights, return_model=return_model,
+        inflation_rate=inflation_rate, sampling=sampling, control_variate=control_variate, streaming=streaming, relative_accuracy=relative_accuracy,
+        periods_per_year=periods_per_year, dtype=np.dtype(dtype), target=target,
+    )
+
+    # Streaming keeps one running sketch; exact and control-variate modes keep every
+    # chunk's paths. Either way each chunk's percentile estimate is kept for the CIs.
+    sketch, chunk_paths, chunk_estimates, observed_error = None, [], [], None
+    path_counts = {}
+    chunks = iter_chunks(_monte_carlo_chunk, inputs, num_trials, seed, workers, chunk_size)
+    for payload, estimate, chunk_error, statistics in chunks:
+        if not streaming:
+            chunk_paths.append(payload)
+        elif sketch is None:
+            sketch, observed_error = payload, chunk_error
+        else:
+            sketch.merge(payload)
+        if target is not None:
+            fire_year_counts, drawdown_counts = statistics
+            path_counts = dict(
+                fire_year_counts=path_counts.get("fire_year_counts", 0) + fire_year_counts,
+                drawdown_counts=path_counts.get("drawdown_counts", 0) + drawdown_counts,
+            )
+        chunk_estimates.append(estimate)
+        estimates = np.array(chunk_estimates)
+        confidence_half_width = _confidence_half_width(estimates)
+        trials_so_far = sum(sizes[:len(chunk_estimates)])
+        converged = (
+            tolerance is not None and len(chunk_estimates) >= MIN_STOPPING_CHUNKS
+            and np.all(confidence_half_width <= tolerance * np.abs(estimates.mean(axis=0)))
+        )
+        if converged or len(chunk_estimates) == len(sizes):
+            break
+        provisional = sketch.quantile(PERCENTILES) if streaming else estimates.mean(axis=0)
+        yield SimulationResult(provisional, trials_so_far, seed, confidence_half_width=confidence_half_width, **path_counts)
+    chunks.close()
+
+    if control_variate:
+        savings_by_year = np.concatenate([paths for paths, _ in chunk_paths], axis=1)
+        controls = np.concatenate([chunk_controls for _, chunk_controls in chunk_paths], axis=1)
+        percentiles = control_variate_percentiles(savings_by_year, controls, PERCENTILES)
+        yield SimulationResult(percentiles, trials_so_far, seed, confidence_half_width=confidence_half_width, **path_counts)
+    elif not streaming:
+        savings_by_year = np.concatenate(chunk_paths, axis=1)
+        yield SimulationResult(np.percentile(savings_by_year, PERCENTILES, axis=1), trials_so_far, seed, confidence_half_width=confidence_half_width, **path_counts)
+    else:
+        yield SimulationResult(sketch.quantile(PERCENTILES), trials_so_far, seed, error_bound=relative_accuracy, observed_error=observed_error, confidence_half_width=confidence_half_width, **path_counts)
+
+
+def _confidence_half_width(chunk_estimates):
+    # 95% half-width from the spread of independent per-chunk estimates (batch means)
+    num_chunks = len(chunk_estimates)
+    if num_chunks < 2:
+        return None
+    return t_critical(num_chunks - 1) * chunk_estimates.std(axis=0, ddof=1) / np.sqrt(num_chunks)
+
+
+def sketch_error(savings_by_year, relative_accuracy):
+    # Largest relative difference between sketch and exact percentiles for one chunk
+    sketch = QuantileSketch(savings_by_year.shape[0], relative_accuracy)
+    sketch.add(savings_by_year)
+    exact = np.percentile(savings_by_year, PERCENTILES, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        relative = np.abs(sketch.quantile(PERCENTILES) - exact) / np.abs(exact)
+    relative = relative[np.isfinite(relative)]
+    return float(relative.max()) if relative.size else 0.0
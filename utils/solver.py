@@ -0,0 +1,65 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from utils.simulation import DEFAULT_CHUNK_SIZE, evolve_savings, per_period_inputs, period_weights, run_chunks, sample_portfolio_returns
+
+# Inverse questions on one fixed set of simulated returns (common random numbers): the
+# savings needed for a target chance of reaching a goal, and the earliest year a goal is
+# reached with a given chance. Savings are affine in the annual contribution,
+#     savings_by_year = current_savings * growth + annual_savings * contribution_value
+# so after one simulation of growth and contribution_value every candidate contribution
+# or year is a cheap re-evaluation, and the searches below are exact for the draws.
+
+
+@dataclass
+class SavingsResponse:
+    growth: np.ndarray  # (years x trials) growth of $1 held from today
+    contribution_value: np.ndarray  # (years x trials) value of $1 a year of contributions
+    current_savings: float
+    seed: int
+
+    def savings_by_year(self, annual_savings):
+        return self.current_savings * self.growth + annual_savings * self.contribution_value
+
+    def success_probability(self, annual_savings, target):
+        # (years,) share of trials at or above target at the end of each year
+        return (self.savings_by_year(annual_savings) >= target).mean(axis=1)
+
+    def required_annual_savings(self, target, probability, years=None):
+        # Smallest annual contribution reaching target after `years` (default: all) in at
+        # least `probability` of trials; negative when the goal is met with money to spare,
+        # np.inf when it cannot be met in that share of trials at any contribution
+        year = (years or self.growth.shape[0]) - 1
+        with np.errstate(divide="ignore", invalid="ignore"):
+            needed = np.where(
+                self.contribution_value[year] > 0,
+                (target - self.current_savings * self.growth[year]) / self.contribution_value[year],
+                np.where(self.current_savings * self.growth[year] >= target, -np.inf, np.inf),
+            )
+        return float(np.quantile(needed, probability, method="inverted_cdf"))
+
+    def years_to_target(self, annual_savings, target, probability):
+        # First year whose success probability reaches `probability`; np.inf if none
+        reached = np.flatnonzero(self.success_probability(annual_savings, target) >= probability)
+        return float(reached[0] + 1) if len(reached) else np.inf
+
+
+def _response_chunk(chunk_index, rng, num_trials, years, weights, return_model, inflation_rate, periods_per_year):
+    real_returns = sample_portfolio_returns(return_model, rng, num_trials, years * periods_per_year, weights)
+    real_returns -= inflation_rate
+    return evolve_savings(1.0, 0.0, real_returns, periods_per_year), evolve_savings(0.0, 1.0, real_returns, periods_per_year)
+
+
+def simulate_savings_response(current_savings, years, weights, return_model, inflation_rate, num_trials, seed=None, workers=1, periods_per_year=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    # One chunked, seeded simulation (see run_chunks) of the growth and contribution
+    # values behind every savings path; inflation_rate is a fraction
+    return_model, inflation_rate = per_period_inputs(return_model, weights, inflation_rate, periods_per_year)
+    inputs = dict(years=years, weights=period_weights(weights, periods_per_year), return_model=return_model, inflation_rate=inflation_rate, periods_per_year=periods_per_year)
+    chunk_results, seed = run_chunks(_response_chunk, inputs, num_trials, seed, workers, max(1, chunk_size // periods_per_year))
+    return SavingsResponse(
+        np.concatenate([growth for growth, _ in chunk_results], axis=1),
+        np.concatenate([contribution_value for _, contribution_value in chunk_results], axis=1),
+        float(current_savings),
+        seed,
+    )
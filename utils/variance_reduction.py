@@ -0,0 +1,86 @@
+import warnings
+
+import numpy as np
+
+# Ways to draw the standard normal shocks behind Gaussian return models
+SAMPLING_METHODS = ["random", "antithetic", "sobol"]
+
+# Two-sided 95% Student-t critical values by degrees of freedom
+_T_CRITICAL_95 = [
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+]
+
+
+def t_critical(degrees_of_freedom):
+    if degrees_of_freedom < 1:
+        return np.nan
+    if degrees_of_freedom > len(_T_CRITICAL_95):
+        return 1.96
+    return _T_CRITICAL_95[degrees_of_freedom - 1]
+
+
+def standard_normals(rng, num_trials, years, sampling="random"):
+    # (trials x years) standard normal shocks.
+    #   "antithetic": the second half of the trials mirrors the first (z and -z)
+    #   "sobol":      scrambled Sobol points (one dimension per year) mapped through the
+    #                 inverse normal CDF; needs scipy
+    if sampling == "random":
+        return rng.standard_normal((num_trials, years))
+    if sampling == "antithetic":
+        half = rng.standard_normal(((num_trials + 1) // 2, years))
+        return np.concatenate([half, -half])[:num_trials]
+    if sampling == "sobol":
+        from scipy.special import ndtri
+        from scipy.stats import qmc
+
+        sampler = qmc.Sobol(years, scramble=True, seed=rng)
+        with warnings.catch_warnings():
+            # Sobol balance properties hold for powers of two; any count is still valid
+            warnings.simplefilter("ignore", UserWarning)
+            return ndtri(sampler.random(num_trials))
+    raise ValueError(f"Unknown sampling method: {sampling}")
+
+
+def control_variates(current_savings, annual_savings, real_returns, mean_real_return, periods_per_year=1):
+    # First-order expansion of every savings path around the closed-form deterministic
+    # projection (all periods at mean_real_return):
+    #     control_t = control_{t-1} * (1 + mean) + projection_{t-1} * (return_t - mean)
+    # It tracks the simulated savings closely and its expectation is exactly zero.
+    # Takes (trials x periods) real returns, gives (years x trials) controls at each year
+    # end, matching evolve_savings.
+    num_trials, num_periods = real_returns.shape
+    deviations = np.ascontiguousarray(real_returns.T, dtype=float)
+    deviations -= mean_real_return
+    controls = np.empty((num_periods // periods_per_year, num_trials))
+    control = np.zeros(num_trials)
+    projection = float(current_savings)
+    contribution = annual_savings / periods_per_year
+    for period in range(num_periods):
+        control *= 1 + mean_real_return
+        control += projection * deviations[period]
+        projection = projection * (1 + mean_real_return) + contribution
+        if (period + 1) % periods_per_year == 0:
+            controls[period // periods_per_year] = control
+    return controls
+
+
+def control_variate_percentiles(values, controls, percentiles):
+    # Percentiles per row of values (years x trials) from the control-variate weighted
+    # empirical CDF (Hesterberg & Nelson): weights 1/n - mean(c) * (c - mean(c)) / sum((c - mean(c))^2)
+    # sum to one and make the weighted mean of the zero-mean control exactly zero.
+    num_trials = values.shape[1]
+    centered = controls - controls.mean(axis=1, keepdims=True)
+    sum_of_squares = (centered ** 2).sum(axis=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where(sum_of_squares > 0, -controls.mean(axis=1, keepdims=True) / sum_of_squares, 0.0)
+    weights = 1 / num_trials + slope * centered
+    order = np.argsort(values, axis=1)
+    sorted_values = np.take_along_axis(values, order, axis=1)
+    cumulative = np.cumsum(np.take_along_axis(weights, order, axis=1), axis=1)
+    estimates = np.empty((len(percentiles), values.shape[0]))
+    for i, percentile in enumerate(percentiles):
+        index = np.argmax(cumulative >= percentile / 100, axis=1)
+        estimates[i] = sorted_values[np.arange(values.shape[0]), index]
+    return estimates